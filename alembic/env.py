@@ -12,6 +12,9 @@ from app.core.config import settings
 from app.database import Base
 import app.models.user
 import app.models.music
+import app.models.stats
+import app.models.fingerprint
+import app.models.trending
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,55 @@
+"""add created_at to collections/reviews, item_popularity and trending_items
+
+Revision ID: a8b9c0d1e2f3
+Revises: f7a8b9c0d1e2
+Create Date: 2026-10-19 16:00:00.000000
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8b9c0d1e2f3'
+down_revision: Union[str, Sequence[str], None] = 'f7a8b9c0d1e2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ['reviews', 'user_collections']
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        # Existing rows stay NULL: their creation time is unknown (updated_at is the time of
+        # d4e5f6a7b8c9 or of the last edit), and the trending backfill skips them.
+        # The default only applies to rows inserted from now on.
+        op.add_column(table, sa.Column('created_at', sa.TIMESTAMP(timezone=True), nullable=True))
+        op.alter_column(table, 'created_at', server_default=sa.text('now()'))
+    op.create_table(
+        'item_popularity',
+        sa.Column('music_item_id', sa.Integer(), nullable=False),
+        sa.Column('bucket', sa.Integer(), nullable=False),
+        sa.Column('span', sa.SmallInteger(), nullable=False, server_default='1'),
+        sa.Column('hits', sa.Float(), nullable=False, server_default='0'),
+        sa.ForeignKeyConstraint(['music_item_id'], ['music_items.id'], name='fk_item_popularity_item', ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('music_item_id', 'bucket', 'span', name='pk_item_popularity')
+    )
+    op.create_index('ix_item_popularity_bucket', 'item_popularity', ['bucket'])
+    op.create_table(
+        'trending_items',
+        sa.Column('window', sa.String(length=8), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.Column('rank', sa.SmallInteger(), nullable=False),
+        sa.Column('music_item_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['music_item_id'], ['music_items.id'], name='fk_trending_items_item', ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('window', 'genre_id', 'rank', name='pk_trending_items')
+    )
+    # Counters for the last week from existing collections/reviews: python -m app.core.trending --backfill
+
+
+def downgrade() -> None:
+    op.drop_table('trending_items')
+    op.drop_index('ix_item_popularity_bucket', table_name='item_popularity')
+    op.drop_table('item_popularity')
+    for table in TABLES:
+        op.drop_column(table, 'created_at')
@@ -0,0 +1,54 @@
+"""on delete cascade for rows owned by music items
+
+Revision ID: c3d4e5f6a7b8
+Revises: b2c3d4e5f6
+Create Date: 2026-10-19 10:00:00.000000
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3d4e5f6a7b8'
+down_revision: Union[str, Sequence[str], None] = 'b2c3d4e5f6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (table, column, constraint name before, constraint name after)
+# The names before are what downgrade recreates; both directions drop whatever the database actually has
+# (the init migration is empty, so nothing guarantees the Postgres default <table>_<column>_fkey).
+FOREIGN_KEYS = [
+    ('music_item_artists', 'music_item_id', 'music_item_artists_music_item_id_fkey', 'fk_music_item_artists_item'),
+    ('music_item_genres', 'music_item_id', 'music_item_genres_music_item_id_fkey', 'fk_music_item_genres_item'),
+    ('reviews', 'music_item_id', 'reviews_music_item_id_fkey', 'fk_reviews_item'),
+    ('user_collections', 'music_item_id', 'user_collections_music_item_id_fkey', 'fk_user_collections_item'),
+    ('album_tracks', 'album_id', 'fk_album_tracks_album', 'fk_album_tracks_album'),
+    ('album_tracks', 'track_id', 'fk_album_tracks_track', 'fk_album_tracks_track'),
+    ('track_files', 'track_id', 'fk_track_files_track', 'fk_track_files_track'),
+]
+
+
+def _foreign_keys(table: str, column: str) -> list[str]:
+    # fresh inspector per table: it caches, and the constraints change as we go
+    return [fk['name'] for fk in sa.inspect(op.get_bind()).get_foreign_keys(table)
+            if fk['referred_table'] == 'music_items' and fk['constrained_columns'] == [column]]
+
+
+def _drop_foreign_keys(table: str, column: str):
+    names = _foreign_keys(table, column)
+    if not names:
+        raise RuntimeError(f'{table}.{column}: no foreign key to music_items found, refusing to guess')
+    for name in names:
+        op.drop_constraint(name, table, type_='foreignkey')
+
+
+def upgrade() -> None:
+    for table, column, old_name, new_name in FOREIGN_KEYS:
+        _drop_foreign_keys(table, column)
+        op.create_foreign_key(new_name, table, 'music_items', [column], ['id'], ondelete='CASCADE')
+
+
+def downgrade() -> None:
+    for table, column, old_name, new_name in FOREIGN_KEYS:
+        _drop_foreign_keys(table, column)
+        op.create_foreign_key(old_name, table, 'music_items', [column], ['id'])
@@ -0,0 +1,37 @@
+"""add user_stats
+
+Revision ID: e5f6a7b8c9d0
+Revises: d4e5f6a7b8c9
+Create Date: 2026-10-19 12:00:00.000000
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5f6a7b8c9d0'
+down_revision: Union[str, Sequence[str], None] = 'd4e5f6a7b8c9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    op.create_table(
+        'user_stats',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('item_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_duration_seconds', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('like_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('dislike_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('favourite_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('genre_counts', sa.JSON(), nullable=False, server_default='{}'),
+        sa.Column('artist_counts', sa.JSON(), nullable=False, server_default='{}'),
+        sa.Column('favourite_decades', sa.JSON(), nullable=False, server_default='{}'),
+        sa.Column('updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()')),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], name='fk_user_stats_user', ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', name='pk_user_stats')
+    )
+    # Existing collections: fill the table once with `python -m app.core.stats` after upgrading
+
+
+def downgrade() -> None:
+    op.drop_table('user_stats')
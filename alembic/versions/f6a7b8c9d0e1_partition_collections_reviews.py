@@ -0,0 +1,42 @@
+"""optional hash partitioning of user_collections and reviews
+
+Revision ID: f6a7b8c9d0e1
+Revises: e5f6a7b8c9d0
+Create Date: 2026-10-19 14:00:00.000000
+
+Only converts when asked for and on Postgres:
+
+    alembic -x partitions=16 upgrade head
+
+Without -x partitions the tables stay plain (they can be converted later with
+python -m app.core.partitioning 16). The copy runs in batches outside the migration
+transaction, see app/core/partitioning.py.
+"""
+from typing import Sequence, Union
+from alembic import op, context
+
+from app.core.partitioning import TABLES, convert, partition_count
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6a7b8c9d0e1'
+down_revision: Union[str, Sequence[str], None] = 'e5f6a7b8c9d0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    partitions = int(context.get_x_argument(as_dictionary=True).get('partitions', 0))
+    if not partitions or op.get_bind().dialect.name != 'postgresql':
+        return
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            convert(op.get_bind(), table, partitions)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            if partition_count(op.get_bind(), table) is not None:
+                convert(op.get_bind(), table, None)
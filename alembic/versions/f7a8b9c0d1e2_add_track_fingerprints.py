@@ -0,0 +1,41 @@
+"""add track_fingerprints and fingerprint_bands
+
+Revision ID: f7a8b9c0d1e2
+Revises: f6a7b8c9d0e1
+Create Date: 2026-10-19 15:00:00.000000
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'f7a8b9c0d1e2'
+down_revision: Union[str, Sequence[str], None] = 'f6a7b8c9d0e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    op.create_table(
+        'track_fingerprints',
+        sa.Column('track_id', sa.Integer(), nullable=False),
+        sa.Column('signature', sa.LargeBinary(), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()')),
+        sa.ForeignKeyConstraint(['track_id'], ['music_items.id'], name='fk_track_fingerprints_track', ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('track_id', name='pk_track_fingerprints')
+    )
+    op.create_table(
+        'fingerprint_bands',
+        sa.Column('band', sa.SmallInteger(), nullable=False),
+        sa.Column('bucket', sa.BigInteger(), nullable=False),
+        sa.Column('track_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['track_id'], ['track_fingerprints.track_id'], name='fk_fingerprint_bands_track', ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('band', 'bucket', 'track_id', name='pk_fingerprint_bands')
+    )
+    op.create_index('ix_fingerprint_bands_track_id', 'fingerprint_bands', ['track_id'])
+    # Files uploaded before this migration: python -m app.core.fingerprint
+
+
+def downgrade() -> None:
+    op.drop_index('ix_fingerprint_bands_track_id', table_name='fingerprint_bands')
+    op.drop_table('fingerprint_bands')
+    op.drop_table('track_fingerprints')
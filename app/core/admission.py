@@ -0,0 +1,167 @@
+import asyncio
+import threading
+import time
+
+from fastapi import Depends, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+from app import models
+from app.core.auth import get_current_user
+from app.core.config import settings
+from app.database import engine
+
+# Admission control for the expensive routes: per user (or client) + route token buckets (429),
+# concurrency caps for upload/transcode and early load shedding when the DB pool is
+# exhausted (503). Everything answers with Retry-After so well behaved clients back off.
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take one token. Returns 0 on success, otherwise seconds until a token is available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class MemoryBackend:
+    """Per worker state. Limits are per process, so with N workers a client gets up to N x the rate."""
+
+    MAX_BUCKETS = 50_000
+
+    def __init__(self):
+        self.buckets: dict[tuple[str, str], TokenBucket] = {}
+        self.lock = threading.Lock()
+
+    def take(self, route: str, identity: str, rate: float, burst: int) -> float:
+        with self.lock:
+            bucket = self.buckets.get((route, identity))
+            if bucket is None:
+                if len(self.buckets) >= self.MAX_BUCKETS:
+                    self._evict_idle()
+                bucket = self.buckets[(route, identity)] = TokenBucket(rate, burst)
+            return bucket.take()
+
+    def _evict_idle(self):
+        # Buckets that would be full again carry no state worth keeping
+        now = time.monotonic()
+        for key, b in list(self.buckets.items()):
+            if b.tokens + (now - b.updated) * b.rate >= b.burst:
+                del self.buckets[key]
+
+
+class RedisBackend:
+    """Shared across workers/hosts. Uses a fixed window of burst/rate seconds allowing `burst`
+    requests - an approximation of the token bucket that needs one INCR per request.
+    Needs the optional `redis` package."""
+
+    def __init__(self, url: str):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def take(self, route: str, identity: str, rate: float, burst: int) -> float:
+        window = max(1, int(burst / rate))
+        now = time.time()
+        slot = int(now // window)
+        key = f"rl:{route}:{identity}:{slot}"
+        pipe = self.client.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, window + 1)
+        count, _ = pipe.execute()
+        if count <= burst:
+            return 0.0
+        return (slot + 1) * window - now
+
+
+def _make_backend():
+    if settings.rate_limit_backend == "redis":
+        return RedisBackend(settings.rate_limit_redis_url)
+    return MemoryBackend()
+
+
+backend = _make_backend()
+
+
+def _client(request: Request) -> str:
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def _retry_after(seconds: float) -> dict:
+    return {"Retry-After": str(max(1, int(seconds + 0.999)))}
+
+
+def pool_saturated() -> bool:
+    pool = engine.pool
+    if not hasattr(pool, "checkedout") or not hasattr(pool, "size"):
+        return False  # e.g. SQLite test setups
+    return pool.checkedout() >= pool.size() + settings.db_max_overflow
+
+
+def limit(route: str, rate: float, burst: int, shed_on_pool: bool = True, per_user: bool = False):
+    """Dependency factory: `dependencies=[Depends(limit("upload", rate=0.2, burst=3, per_user=True))]`.
+    rate is tokens per second, burst the bucket size. Buckets are per client address, with
+    per_user (authenticated routes) per user as resolved by get_current_user - never per the
+    raw X-User-Id header, a client could simply rotate it."""
+
+    def check(identity: str):
+        if not settings.rate_limits_enabled:
+            return
+        if shed_on_pool and pool_saturated():
+            raise HTTPException(status_code=503, detail="Server busy, try again shortly", headers=_retry_after(1))
+        wait = backend.take(route, identity, rate, burst)
+        if wait:
+            raise HTTPException(status_code=429, detail=f"Rate limit exceeded for {route}", headers=_retry_after(wait))
+
+    if per_user:
+        # get_current_user is cached per request, the route's own auth dependency reuses it
+        async def dependency(user: models.User = Depends(get_current_user)):
+            check(f"user:{user.id}")
+    else:
+        async def dependency(request: Request):
+            check(_client(request))
+
+    return dependency
+
+
+# Concurrency caps. Uploads are refused immediately when full, transcodes queue up - on the
+# event loop, so a queued transcode doesn't occupy a threadpool thread while it waits.
+_upload_slots = asyncio.Semaphore(settings.max_concurrent_uploads)
+transcode_slots = asyncio.Semaphore(settings.max_concurrent_transcodes)
+
+
+class UploadSlot:
+    """Held from the start of an upload request until release() (at the latest when the
+    request's dependencies are torn down, i.e. after the response and its background tasks)."""
+
+    def __init__(self):
+        self.held = True
+
+    def release(self):
+        if self.held:
+            self.held = False
+            _upload_slots.release()
+
+
+async def upload_slot():
+    if _upload_slots.locked():
+        raise HTTPException(status_code=503, detail="Too many uploads in progress", headers=_retry_after(5))
+    await _upload_slots.acquire()
+    slot = UploadSlot()
+    try:
+        yield slot
+    finally:
+        slot.release()
+
+
+async def pool_timeout_handler(request: Request, exc: Exception):
+    # Waited longer than APP_DB_POOL_TIMEOUT for a connection - shed instead of piling up
+    return JSONResponse(status_code=503, content={"detail": "Database busy, try again shortly"}, headers=_retry_after(1))
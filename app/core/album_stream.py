@@ -0,0 +1,134 @@
+"""Byte level view of an album as one continuous MP3 stream.
+
+The album's stored track files are laid end to end in track_number order. ID3 tags are
+cut off (ID3v2 header at the start, ID3v1 trailer at the end), and so is each file's
+Xing/Info (or VBRI) frame: it carries the frame count and seek table of that one file, so
+the first would misreport the album's duration and seeking, and the later ones decode as
+short silences between tracks. Only the audio frames are concatenated - players decode
+that as one gapless stream, nothing is re-encoded.
+A byte range of the album maps to (track file, offset) pieces, which are read from
+track_files.file_data with substr() in chunks, so no blob is ever loaded completely.
+"""
+import re
+from typing import Iterator, NamedTuple, Optional
+
+from sqlalchemy import select, func, LargeBinary
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import SessionLocal
+
+CHUNK_SIZE = 256 * 1024
+HEAD_SIZE = 4096  # bytes read from the start of each file: ID3v2 header and usually the first frame
+
+# Layer III bit rates (kbit/s) by bitrate index, sample rates by version bits (3: MPEG 1, 2: MPEG 2, 0: MPEG 2.5)
+_KBPS_MPEG1 = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+_KBPS_MPEG2 = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+class Segment(NamedTuple):
+    track_file_id: int
+    offset: int  # first frame byte inside the blob (0 based)
+    length: int  # bytes of MPEG frames
+
+
+def _id3v2_size(head: bytes) -> int:
+    if len(head) < 10 or head[:3] != b"ID3":
+        return 0
+    # 4 byte syncsafe integer (7 bits per byte), +10 header, +10 when a footer is present
+    size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+    return 10 + size + (10 if head[5] & 0x10 else 0)
+
+
+def _info_frame_size(frame: bytes) -> int:
+    """Length of the MPEG Layer III frame at the start of frame when it is a Xing/Info/VBRI
+    header frame, 0 for an audio frame (or anything unrecognised)."""
+    if len(frame) < 40 or frame[0] != 0xFF or frame[1] & 0xE0 != 0xE0:
+        return 0
+    version, layer = (frame[1] >> 3) & 3, (frame[1] >> 1) & 3
+    bitrate_index, rate_index = frame[2] >> 4, (frame[2] >> 2) & 3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return 0
+    mpeg1, mono = version == 3, frame[3] >> 6 == 3
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    if frame[4 + side_info:8 + side_info] not in (b"Xing", b"Info") and frame[36:40] != b"VBRI":
+        return 0
+    kbps = (_KBPS_MPEG1 if mpeg1 else _KBPS_MPEG2)[bitrate_index]
+    padding = (frame[2] >> 1) & 1
+    return (144 if mpeg1 else 72) * kbps * 1000 // _SAMPLE_RATES[version][rate_index] + padding
+
+
+def album_segments(db: Session, album_id: int) -> list[Segment]:
+    """Frame ranges of the album's ready track files in track_number order (one query, blobs
+    stay in the DB; one more per file whose ID3 tag is larger than HEAD_SIZE, e.g. cover art)."""
+    tf, at = models.TrackFile, models.AlbumTrack
+    length = func.length(tf.file_data)
+    rows = db.execute(
+        select(tf.id, length,
+               func.substr(tf.file_data, 1, HEAD_SIZE, type_=LargeBinary),
+               func.substr(tf.file_data, length - 127, 3, type_=LargeBinary))
+        .join(at, at.track_id == tf.track_id)
+        .where(at.album_id == album_id, length > 0)
+        .order_by(at.track_number)
+    ).all()
+    segments = []
+    for tf_id, size, head, tail in rows:
+        head = bytes(head or b"")
+        start = _id3v2_size(head)
+        frame = head[start:start + 40]
+        if len(frame) < 40 and start + 40 <= size:
+            frame = bytes(db.execute(select(func.substr(tf.file_data, start + 1, 40, type_=LargeBinary))
+                                     .where(tf.id == tf_id)).scalar() or b"")
+        start += _info_frame_size(frame)
+        end = size - 128 if size >= 128 and bytes(tail or b"") == b"TAG" else size
+        if end > start:
+            segments.append(Segment(tf_id, start, end - start))
+    return segments
+
+
+def parse_range(header: Optional[str], total: int) -> Optional[tuple[int, int]]:
+    """Single "bytes=" range -> (start, end) inclusive. None means serve everything
+    (no header, or several ranges). Raises ValueError when the range is unsatisfiable."""
+    if not header:
+        return None
+    m = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", header)
+    if not m:
+        return None
+    first, last = m.groups()
+    if first == "" and last == "":
+        return None
+    if first == "":
+        # suffix range: the last N bytes
+        start, end = max(total - int(last), 0), total - 1
+    else:
+        start = int(first)
+        end = min(int(last), total - 1) if last else total - 1
+    if start >= total or start > end:
+        raise ValueError("unsatisfiable range")
+    return start, end
+
+
+def iter_range(segments: list[Segment], start: int, end: int) -> Iterator[bytes]:
+    """Yield album bytes start..end (inclusive) across track boundaries.
+    A short session per chunk: players keep the response open for the whole playback, and
+    holding a pooled connection (and transaction) that long would drain the pool."""
+    tf = models.TrackFile
+    pos = 0  # album offset of the current segment
+    for seg in segments:
+        seg_end = pos + seg.length - 1
+        if seg_end >= start and pos <= end:
+            a = max(start, pos) - pos  # offsets inside the segment
+            b = min(end, seg_end) - pos
+            while a <= b:
+                n = min(CHUNK_SIZE, b - a + 1)
+                with SessionLocal() as db:
+                    chunk = db.execute(select(func.substr(tf.file_data, seg.offset + a + 1, n, type_=LargeBinary))
+                                       .where(tf.id == seg.track_file_id)).scalar()
+                if not chunk:
+                    return  # file replaced/deleted while streaming
+                yield bytes(chunk)
+                a += n
+        pos += seg.length
+        if pos > end:
+            break
@@ -1,12 +1,17 @@
 from fastapi import APIRouter, Depends, Header, HTTPException, status
 from typing import Optional
+from sqlalchemy import select, bindparam
 from sqlalchemy.orm import Session
 
 from app.database import get_db
 from app import models, schemas
+from app.core.budgets import query_budget
 
 router = APIRouter()
 
+# Runs on every authenticated request: built once, its cache key is memoized
+USER_BY_ID = select(models.User).where(models.User.id == bindparam("user_id"))
+
 # Very lightweight demo authentication. - Task 3 will fix that.
 def get_current_user(
     db: Session = Depends(get_db),
@@ -16,7 +21,7 @@ def get_current_user(
     if x_user_id is None or x_role is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail="Provide X-User-Id and X-Role headers.")
-    user = db.get(models.User, x_user_id)
+    user = db.execute(USER_BY_ID, {"user_id": x_user_id}).scalar_one_or_none()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if user.role != x_role:
@@ -29,6 +34,7 @@ def require_admin(user: models.User = Depends(get_current_user)) -> models.User:
     return user
 
 @router.post("/users", response_model=schemas.UserOut, status_code=201)
+@query_budget(queries=2, ms=100)
 def create_user(payload: schemas.UserCreate, db: Session = Depends(get_db)):
     user = models.User(email=payload.email, display_name=payload.display_name, role=payload.role)
     db.add(user)
@@ -37,5 +43,6 @@ def create_user(payload: schemas.UserCreate, db: Session = Depends(get_db)):
     return user
 
 @router.get("/users", response_model=list[schemas.UserOut])
+@query_budget(queries=1, ms=150)
 def list_users(db: Session = Depends(get_db)):
     return db.query(models.User).all()
\ No newline at end of file
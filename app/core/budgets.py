@@ -0,0 +1,24 @@
+from typing import NamedTuple
+
+# Per-route performance budgets, declared next to the route:
+#
+#     @router.get("/{item_id}", ...)
+#     @query_budget(queries=6, ms=50)
+#     def get_music_item(...):
+#
+# benchmarks/query_budgets.py runs every route against seeded databases of several sizes
+# and fails when a route issues more SQL statements or takes longer than declared, or when
+# its statement count grows with the data size (an N+1 query, e.g. a missing selectinload).
+
+
+class QueryBudget(NamedTuple):
+    queries: int  # max SQL statements per request (auth lookup included)
+    ms: float  # max wall time per request at the largest data size
+    constant: bool = True  # statement count must be the same for every data size
+
+
+def query_budget(queries: int, ms: float, constant: bool = True):
+    def decorate(fn):
+        fn.query_budget = QueryBudget(queries, ms, constant)
+        return fn
+    return decorate
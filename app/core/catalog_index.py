@@ -0,0 +1,253 @@
+"""Optional in-process, read-only browse index for list_music_items (APP_CATALOG_INDEX_ENABLED).
+
+The catalog is small and changes rarely, so every worker keeps a compact copy:
+item records plus sorted id postings (array('q')) per genre and per artist and the
+ordered track list per album. Genre/artist filters become sorted-array intersections
+and pagination is a slice - no database round trip.
+
+Freshness: the index follows music_item.* events from the event hub and reloads only
+the changed items. A periodic check compares item count and max(updated_at) with the
+database; on mismatch, or when events were dropped, the index is marked stale and
+rebuilt in the background. While stale (or not built yet) callers fall back to SQL.
+"""
+import asyncio
+import threading
+from array import array
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select, func
+
+from app import models, schemas
+from app.core.config import settings
+from app.database import SessionLocal
+
+
+class ItemRecord(NamedTuple):
+    title: str
+    title_folded: str  # for case-insensitive title search (like ILIKE)
+    item_type: str
+    release_year: Optional[int]
+    duration_seconds: Optional[int]
+    artist_ids: tuple
+    genre_ids: tuple
+    updated_at: Optional[datetime]
+
+
+def _contains(posting: array, item_id: int) -> bool:
+    i = bisect_left(posting, item_id)
+    return i < len(posting) and posting[i] == item_id
+
+
+def _discard(posting: array, item_id: int):
+    i = bisect_left(posting, item_id)
+    if i < len(posting) and posting[i] == item_id:
+        del posting[i]
+
+
+def _discard_all(posting: array, item_id: int):
+    # album track lists are ordered by track number, not by id
+    while item_id in posting:
+        posting.remove(item_id)
+
+
+class CatalogIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ready = False
+        self.stale = True
+        self._reset()
+
+    def _reset(self):
+        self.items: dict[int, ItemRecord] = {}
+        self.all_ids = array("q")
+        self.by_genre: dict[int, array] = {}
+        self.by_artist: dict[int, array] = {}
+        self.album_tracks: dict[int, array] = {}  # album id -> track ids in track_number order
+        self.artist_names: dict[int, str] = {}
+        self.genre_names: dict[int, str] = {}
+
+    # --- loading -------------------------------------------------------------------
+
+    def _load(self, db, ids=None) -> dict:
+        """Reads items (all or the given ids) and their links. Returns plain data, no locking."""
+        def scoped(stmt, column):
+            return stmt if ids is None else stmt.where(column.in_(ids))
+
+        artist_links, genre_links, tracks = {}, {}, {}
+        for mid, aid in db.execute(scoped(select(models.MusicItemArtist.music_item_id, models.MusicItemArtist.artist_id), models.MusicItemArtist.music_item_id).execution_options(yield_per=5000)):
+            artist_links.setdefault(mid, set()).add(aid)
+        for mid, gid in db.execute(scoped(select(models.MusicItemGenre.music_item_id, models.MusicItemGenre.genre_id), models.MusicItemGenre.music_item_id).execution_options(yield_per=5000)):
+            genre_links.setdefault(mid, set()).add(gid)
+        stmt = scoped(select(models.AlbumTrack.album_id, models.AlbumTrack.track_id), models.AlbumTrack.album_id)
+        for album_id, track_id in db.execute(stmt.order_by(models.AlbumTrack.album_id, models.AlbumTrack.track_number).execution_options(yield_per=5000)):
+            tracks.setdefault(album_id, array("q")).append(track_id)
+
+        records = {}
+        stmt = scoped(select(models.MusicItem.id, models.MusicItem.title, models.MusicItem.item_type, models.MusicItem.release_year,
+                             models.MusicItem.duration_seconds, models.MusicItem.updated_at), models.MusicItem.id)
+        for row in db.execute(stmt.execution_options(yield_per=5000)):
+            records[row.id] = ItemRecord(row.title, row.title.casefold(), row.item_type, row.release_year, row.duration_seconds,
+                                         tuple(sorted(artist_links.get(row.id, ()))), tuple(sorted(genre_links.get(row.id, ()))), row.updated_at)
+        return {
+            "records": records,
+            "tracks": tracks,
+            # Names are tiny; always reload so newly created artists/genres are known
+            "artist_names": dict(db.execute(select(models.Artist.id, models.Artist.name)).all()),
+            "genre_names": dict(db.execute(select(models.Genre.id, models.Genre.name)).all()),
+        }
+
+    def build(self):
+        db = SessionLocal()
+        try:
+            data = self._load(db)
+        finally:
+            db.close()
+        by_genre, by_artist = {}, {}
+        for item_id in sorted(data["records"]):
+            rec = data["records"][item_id]
+            for gid in rec.genre_ids:
+                by_genre.setdefault(gid, array("q")).append(item_id)
+            for aid in rec.artist_ids:
+                by_artist.setdefault(aid, array("q")).append(item_id)
+        with self.lock:
+            self.items = data["records"]
+            self.all_ids = array("q", sorted(self.items))
+            self.by_genre, self.by_artist = by_genre, by_artist
+            self.album_tracks = data["tracks"]
+            self.artist_names, self.genre_names = data["artist_names"], data["genre_names"]
+            self.ready, self.stale = True, False
+        print(f"[catalog-index] built with {len(self.items)} items")
+
+    def refresh(self, ids: set[int]):
+        """Reload the given items; ids no longer in the database are removed."""
+        db = SessionLocal()
+        try:
+            data = self._load(db, ids)
+        finally:
+            db.close()
+        with self.lock:
+            for item_id in ids:
+                self._remove(item_id)
+                rec = data["records"].get(item_id)
+                if rec is None:
+                    # deleted: the DB cascade also removed it from every album
+                    for tracks in self.album_tracks.values():
+                        _discard_all(tracks, item_id)
+                    continue
+                self.items[item_id] = rec
+                insort(self.all_ids, item_id)
+                for gid in rec.genre_ids:
+                    insort(self.by_genre.setdefault(gid, array("q")), item_id)
+                for aid in rec.artist_ids:
+                    insort(self.by_artist.setdefault(aid, array("q")), item_id)
+                if item_id in data["tracks"]:
+                    self.album_tracks[item_id] = data["tracks"][item_id]
+            self.artist_names, self.genre_names = data["artist_names"], data["genre_names"]
+
+    def _remove(self, item_id: int):
+        rec = self.items.pop(item_id, None)
+        if rec is None:
+            return
+        _discard(self.all_ids, item_id)
+        for gid in rec.genre_ids:
+            _discard(self.by_genre.get(gid, array("q")), item_id)
+        for aid in rec.artist_ids:
+            _discard(self.by_artist.get(aid, array("q")), item_id)
+        self.album_tracks.pop(item_id, None)
+
+    def is_consistent(self) -> bool:
+        db = SessionLocal()
+        try:
+            count, latest = db.execute(select(func.count(models.MusicItem.id), func.max(models.MusicItem.updated_at))).one()
+        finally:
+            db.close()
+        with self.lock:
+            mine = max((r.updated_at for r in self.items.values() if r.updated_at), default=None)
+            return count == len(self.items) and latest == mine
+
+    # --- reading -------------------------------------------------------------------
+
+    def usable(self) -> bool:
+        return self.ready and not self.stale
+
+    def search(self, q: Optional[str], genre_id: Optional[int], artist_id: Optional[int],
+               offset: int = 0, limit: Optional[int] = None) -> list[schemas.MusicItemOut]:
+        with self.lock:
+            postings = [self.all_ids]
+            if genre_id:
+                postings = [self.by_genre.get(genre_id, array("q"))]
+            if artist_id:
+                postings.append(self.by_artist.get(artist_id, array("q")))
+            # Walk the shortest posting, probe the others by binary search; output stays id sorted
+            postings.sort(key=len)
+            ids = [i for i in postings[0] if all(_contains(p, i) for p in postings[1:])]
+            if q:
+                needle = q.casefold()
+                ids = [i for i in ids if needle in self.items[i].title_folded]
+            ids = ids[offset:offset + limit if limit is not None else None]
+            return [self._serialize(i) for i in ids]
+
+    def _serialize(self, item_id: int, include_tracks: bool = True) -> schemas.MusicItemOut:
+        rec = self.items[item_id]
+        tracks = []
+        if include_tracks and rec.item_type == "ALBUM":
+            tracks = [self._serialize(t, include_tracks=False) for t in self.album_tracks.get(item_id, ()) if t in self.items]
+        return schemas.MusicItemOut(
+            id=item_id, title=rec.title, item_type=rec.item_type, release_year=rec.release_year,
+            duration_seconds=rec.duration_seconds,
+            artists=[schemas.ArtistOut(id=a, name=self.artist_names.get(a, "")) for a in rec.artist_ids],
+            genres=[schemas.GenreOut(id=g, name=self.genre_names.get(g, "")) for g in rec.genre_ids],
+            tracks=tracks,
+        )
+
+    # --- background maintenance ----------------------------------------------------
+
+    async def run(self, hub):
+        """Follows write notifications and periodically checks consistency with the DB."""
+        sub = hub.subscribe({"music_item"})
+        try:
+            while True:
+                try:
+                    await self._step(sub)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # e.g. database unreachable: serve from SQL until a rebuild succeeds
+                    print(f"[catalog-index] maintenance failed, falling back to SQL: {e}")
+                    self.stale = True
+                    await asyncio.sleep(settings.catalog_index_check_seconds)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            hub.unsubscribe(sub)
+
+    async def _step(self, sub):
+        if self.stale:
+            await asyncio.to_thread(self.build)
+        try:
+            event = await asyncio.wait_for(sub.get(), timeout=settings.catalog_index_check_seconds)
+        except asyncio.TimeoutError:
+            if not await asyncio.to_thread(self.is_consistent):
+                print("[catalog-index] out of sync with database, rebuilding")
+                self.stale = True
+            return
+        # collect whatever else arrived meanwhile and reload in one go
+        ids = set(_event_ids(event))
+        while not sub.queue.empty():
+            ids.update(_event_ids(sub.queue.get_nowait()))
+        if sub.dropped:
+            sub.dropped = 0
+            self.stale = True  # missed events - only a rebuild is safe
+            return
+        await asyncio.to_thread(self.refresh, ids)
+
+
+def _event_ids(event: dict) -> list[int]:
+    # a bulk delete carries music_item_ids, every other music_item event a single music_item_id
+    data = event["data"]
+    return data.get("music_item_ids") or [data["music_item_id"]]
+
+
+catalog_index = CatalogIndex()
@@ -3,6 +3,32 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 class Settings(BaseSettings):
     database_url: str #required from .env
     echo_sql: bool #required from .env
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 2.0  # seconds to wait for a pooled connection before answering 503
+    db_prewarm_connections: int = 2  # opened + health checked during startup so the first request doesn't pay for connect/TLS
+    db_query_cache_size: int = 500  # SQLAlchemy compiled statement cache per engine (hit rate: GET /admin/statement-cache)
+    db_prepare_threshold: int = 5  # psycopg: executions before a statement is prepared server side (0: at once, -1: never, e.g. behind PgBouncer < 1.21)
+    db_prepared_max: int = 256  # prepared statements kept per connection (LRU)
+    event_backend: str = "local"  # local | postgres (LISTEN/NOTIFY, needed with several workers)
+    event_queue_size: int = 100  # max buffered events per connected client
+    catalog_index_enabled: bool = False  # in-memory browse index for GET /music-items (see app/core/catalog_index.py)
+    catalog_index_check_seconds: float = 30  # consistency check interval against the DB
+    stats_reconcile_seconds: float = 3600  # recompute user_stats periodically in the app, corrects drift from cascade deletes (0: only via python -m app.core.stats)
+    trending_refresh_seconds: float = 300  # recompute GET /music-items/trending in the app (0: only via python -m app.core.trending)
+    rate_limits_enabled: bool = True
+    rate_limit_backend: str = "memory"  # memory (per worker) | redis (shared, needs `pip install redis`)
+    rate_limit_redis_url: str = "redis://localhost:6379/0"
+    max_concurrent_uploads: int = 4  # per worker
+    max_concurrent_transcodes: int = 2  # per worker
+    ffmpeg_path: str = "ffmpeg"
+    ffprobe_path: str = "ffprobe"
+    transcode_bitrate: str = "64k"
+    transcode_cpu_seconds: float = 120  # CPU time limit per ffmpeg run (POSIX)
+    transcode_timeout_seconds: float = 300  # wall time limit per ffmpeg run
+    fingerprint_enabled: bool = True  # fingerprint uploads for duplicate detection (needs numpy)
+    fingerprint_reuse_blobs: bool = False  # copy the stored file of a matching track instead of transcoding
+    fingerprint_reuse_min_similarity: float = 0.9  # re-encodes of the same master score ~0.95, remasters ~0.75
 
     model_config = SettingsConfigDict(env_file=".env", env_prefix="APP_", extra="ignore")
 
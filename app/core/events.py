@@ -0,0 +1,147 @@
+import asyncio
+import json
+import threading
+from typing import Optional
+
+from sqlalchemy import text
+
+from app.core.config import settings
+
+# Push notifications for clients (SSE / WebSocket), see app/routers/events.py
+# Handlers call publish() after their commit; the broker carries the event to every
+# worker process and each worker fans it out to its own subscribers.
+
+CHANNEL = "music_events"
+
+
+class Subscription:
+    """One connected client. The queue is bounded: when a client is too slow the oldest
+    events are dropped (and counted) instead of growing memory."""
+
+    def __init__(self, types: Optional[set[str]], maxsize: int):
+        self.types = types
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def wants(self, event: dict) -> bool:
+        if not self.types:
+            return True
+        # "track_file" matches "track_file.ready" and "track_file.failed"
+        return any(event["type"] == t or event["type"].startswith(t + ".") for t in self.types)
+
+    def offer(self, event: dict):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+
+class LocalBroker:
+    """In-process broker. Only reaches subscribers of this worker (dev / tests)."""
+
+    def start(self, deliver):
+        self.deliver = deliver
+
+    def publish(self, event: dict):
+        self.deliver(event)
+
+    def stop(self):
+        pass
+
+
+class PostgresBroker:
+    """Fan-out across uvicorn workers using Postgres LISTEN/NOTIFY.
+    Every worker listens on the channel in a background thread; publishing is a pg_notify."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, deliver):
+        self.deliver = deliver
+        self._thread = threading.Thread(target=self._listen, name="event-listener", daemon=True)
+        self._thread.start()
+
+    def publish(self, event: dict):
+        with self.engine.begin() as conn:
+            conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                         {"channel": CHANNEL, "payload": json.dumps(event)})
+
+    def _listen(self):
+        import psycopg
+        # engine url is "postgresql+psycopg://..." - psycopg itself wants the plain form
+        dsn = self.engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        while not self._stop.is_set():
+            try:
+                with psycopg.connect(dsn, autocommit=True) as conn:
+                    conn.execute(f"LISTEN {CHANNEL}")
+                    while not self._stop.is_set():
+                        for notify in conn.notifies(timeout=1.0):
+                            self.deliver(json.loads(notify.payload))
+            except Exception as e:
+                print(f"[events] listener error, reconnecting: {e}")
+                self._stop.wait(2.0)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+
+class EventHub:
+    def __init__(self, broker, queue_size: int = 100):
+        self.broker = broker
+        self.queue_size = queue_size
+        self.subscribers: set[Subscription] = set()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.broker.start(self._deliver)
+
+    def stop(self):
+        self.broker.stop()
+        self.loop = None
+
+    def publish(self, event_type: str, **data):
+        """Safe to call from sync handlers and background tasks (any thread).
+        Never raises - a lost notification must not fail the request that caused it."""
+        if self.loop is None:
+            return
+        try:
+            self.broker.publish({"type": event_type, "data": data})
+        except Exception as e:
+            print(f"[events] publish failed for {event_type}: {e}")
+
+    def _deliver(self, event: dict):
+        # Called from broker threads; hand over to the event loop that owns the queues
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._fanout, event)
+
+    def _fanout(self, event: dict):
+        for sub in list(self.subscribers):
+            if sub.wants(event):
+                sub.offer(event)
+
+    def subscribe(self, types: Optional[set[str]] = None) -> Subscription:
+        sub = Subscription(types, self.queue_size)
+        self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        self.subscribers.discard(sub)
+
+
+def _make_broker():
+    if settings.event_backend == "postgres":
+        from app.database import engine
+        return PostgresBroker(engine)
+    return LocalBroker()
+
+
+hub = EventHub(_make_broker(), queue_size=settings.event_queue_size)
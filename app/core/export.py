@@ -0,0 +1,244 @@
+"""Full catalog export for analytics jobs.
+
+Two formats, both streamed table by table with server-side cursors (yield_per), so
+memory stays bounded no matter how big the catalog is:
+
+* jsonl     - gzip'd JSON lines, one row per line: {"table": "...", "row": {...}}
+* snapshot  - columnar file with typed, 8-byte aligned arrays that can be memory-mapped
+              (see open_snapshot). Layout: MAGIC, u64 header length, JSON header, columns.
+
+`since` exports only music items / reviews / collection entries changed at or after that
+time (plus the link rows of changed items). Deletions are not part of incremental exports.
+
+CLI:  python -m app.core.export jsonl catalog.jsonl.gz [--since 2026-01-01T00:00:00+00:00]
+      python -m app.core.export snapshot catalog.snap
+"""
+import argparse
+import json
+import mmap
+import shutil
+import struct
+import tempfile
+import zlib
+from array import array
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+from sqlalchemy import select, Integer, Boolean, DateTime
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import SessionLocal
+
+YIELD_PER = 1000
+MAGIC = b"MCSNAP1\0"
+INT_NULL = -(2 ** 63)  # null marker in i8 / ts columns
+
+# (table, model, columns, incremental filter)
+# filter: "updated_at" -> own timestamp, "<column>" -> belongs to a changed music item, None -> always full
+EXPORT_TABLES = [
+    ("artists", models.Artist, ("id", "name"), None),
+    ("genres", models.Genre, ("id", "name"), None),
+    ("music_items", models.MusicItem, ("id", "title", "item_type", "release_year", "duration_seconds", "updated_at"), "updated_at"),
+    ("music_item_artists", models.MusicItemArtist, ("music_item_id", "artist_id", "role"), "music_item_id"),
+    ("music_item_genres", models.MusicItemGenre, ("music_item_id", "genre_id"), "music_item_id"),
+    ("album_tracks", models.AlbumTrack, ("album_id", "track_id", "track_number"), "album_id"),
+    ("user_collections", models.UserCollection, ("user_id", "music_item_id", "preference", "is_favourite", "note", "updated_at"), "updated_at"),
+    ("reviews", models.Review, ("id", "user_id", "music_item_id", "rating", "text", "updated_at"), "updated_at"),
+]
+
+
+def _dtype(column) -> str:
+    if isinstance(column.type, Boolean):
+        return "bool"
+    if isinstance(column.type, Integer):
+        return "i8"
+    if isinstance(column.type, DateTime):
+        return "ts"  # int64 microseconds since epoch (UTC)
+    return "str"
+
+
+def _statement(model, columns, incremental, since: Optional[datetime]):
+    stmt = select(*[getattr(model, c) for c in columns])
+    if since is not None and incremental is not None:
+        if incremental == "updated_at":
+            stmt = stmt.where(model.updated_at >= since)
+        else:
+            changed = select(models.MusicItem.id).where(models.MusicItem.updated_at >= since)
+            stmt = stmt.where(getattr(model, incremental).in_(changed))
+    # Stable order helps consumers diffing snapshots; the PK index makes it cheap
+    return stmt.order_by(*model.__table__.primary_key.columns).execution_options(yield_per=YIELD_PER)
+
+
+def iter_tables(db: Session, since: Optional[datetime] = None) -> Iterator[tuple[str, tuple, list, Iterator]]:
+    """Yields (table, column names, dtypes, row iterator). Rows must be consumed before
+    advancing to the next table (they come from an open server-side cursor)."""
+    for table, model, columns, incremental in EXPORT_TABLES:
+        dtypes = [_dtype(getattr(model, c).property.columns[0]) for c in columns]
+        yield table, columns, dtypes, iter(db.execute(_statement(model, columns, incremental, since)))
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def iter_jsonl_gz(db: Session, since: Optional[datetime] = None, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+    buf = []
+    size = 0
+    for table, columns, _, rows in iter_tables(db, since):
+        for row in rows:
+            line = json.dumps({"table": table, "row": {c: _json_value(v) for c, v in zip(columns, row)}}) + "\n"
+            buf.append(line)
+            size += len(line)
+            if size >= chunk_size:
+                out = compressor.compress("".join(buf).encode())
+                buf, size = [], 0
+                if out:
+                    yield out
+    yield compressor.compress("".join(buf).encode()) + compressor.flush()
+
+
+class _Column:
+    """Spools one column to a temp file while rows stream in (bounded memory)."""
+
+    def __init__(self, dtype: str):
+        self.dtype = dtype
+        self.values = tempfile.TemporaryFile()
+        self.strings = tempfile.TemporaryFile() if dtype == "str" else None
+        self.pending = array("b" if dtype == "bool" else "q")
+        self.string_end = 0
+        self.count = 0
+        if dtype == "str":
+            self.pending.append(0)  # offsets array starts with 0 (n + 1 entries)
+
+    def add(self, value):
+        self.count += 1
+        if self.dtype == "str":
+            if value is not None:
+                data = value.encode()
+                self.strings.write(data)
+                self.string_end += len(data)
+            # null and "" both have zero length; null strings are not distinguished
+            self.pending.append(self.string_end)
+        elif self.dtype == "bool":
+            self.pending.append(-1 if value is None else int(value))
+        elif self.dtype == "ts":
+            self.pending.append(INT_NULL if value is None else int(value.replace(tzinfo=value.tzinfo or timezone.utc).timestamp() * 1_000_000))
+        else:
+            self.pending.append(INT_NULL if value is None else value)
+        if len(self.pending) >= YIELD_PER:
+            self._flush()
+
+    def _flush(self):
+        self.values.write(self.pending.tobytes())
+        del self.pending[:]
+
+    def parts(self):
+        """[(name, file)] of the arrays making up this column."""
+        self._flush()
+        if self.dtype == "str":
+            return [("offsets", self.values), ("data", self.strings)]
+        return [("values", self.values)]
+
+
+def write_snapshot(db: Session, path: str, since: Optional[datetime] = None) -> dict:
+    header = {"version": 1, "since": since.isoformat() if since else None,
+              "created_at": datetime.now(timezone.utc).isoformat(), "tables": {}}
+    spooled = []
+    for table, columns, dtypes, rows in iter_tables(db, since):
+        cols = [_Column(dt) for dt in dtypes]
+        count = 0
+        for row in rows:
+            for col, value in zip(cols, row):
+                col.add(value)
+            count += 1
+        header["tables"][table] = {"rows": count, "columns": {}}
+        for name, col in zip(columns, cols):
+            entry = {"dtype": col.dtype}
+            for part, f in col.parts():
+                entry[part] = f.tell()  # size in bytes, offset filled in below
+                spooled.append((table, name, part, f))
+            header["tables"][table]["columns"][name] = entry
+
+    # Column offsets depend on the header size, which depends on the offsets' digits -
+    # reserve a fixed-width number for each offset first.
+    for table, name, part, f in spooled:
+        entry = header["tables"][table]["columns"][name]
+        entry[part] = {"offset": 10 ** 15, "nbytes": entry[part]}
+    header_bytes = json.dumps(header).encode()
+    pos = _align(len(MAGIC) + 8 + len(header_bytes))
+    for table, name, part, f in spooled:
+        entry = header["tables"][table]["columns"][name][part]
+        entry["offset"] = pos
+        pos = _align(pos + entry["nbytes"])
+    header_bytes = json.dumps(header).encode().ljust(len(header_bytes))
+
+    with open(path, "wb") as out:
+        out.write(MAGIC)
+        out.write(struct.pack("<Q", len(header_bytes)))
+        out.write(header_bytes)
+        for table, name, part, f in spooled:
+            entry = header["tables"][table]["columns"][name][part]
+            out.write(b"\0" * (entry["offset"] - out.tell()))
+            f.seek(0)
+            shutil.copyfileobj(f, out)
+            f.close()
+    return header
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def open_snapshot(path: str) -> tuple[dict, dict]:
+    """Memory-map a snapshot. Returns (header, {table: {column: array view}}). Numeric
+    columns are memoryviews of int64 ('q') or int8 ('b'); string columns are
+    (offsets, data) pairs - value i is data[offsets[i]:offsets[i + 1]].
+    With numpy: numpy.frombuffer(view, dtype=numpy.int64) wraps the same memory."""
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mm[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a catalog snapshot")
+    (header_len,) = struct.unpack_from("<Q", mm, len(MAGIC))
+    header = json.loads(bytes(mm[len(MAGIC) + 8:len(MAGIC) + 8 + header_len]))
+    view = memoryview(mm)
+    tables = {}
+    for table, meta in header["tables"].items():
+        cols = {}
+        for name, entry in meta["columns"].items():
+            def part(key, fmt=None):
+                p = entry[key]
+                raw = view[p["offset"]:p["offset"] + p["nbytes"]]
+                return raw.cast(fmt) if fmt else raw
+            if entry["dtype"] == "str":
+                cols[name] = (part("offsets", "q"), part("data"))
+            else:
+                cols[name] = part("values", "b" if entry["dtype"] == "bool" else "q")
+        tables[table] = cols
+    return header, tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the music catalog")
+    parser.add_argument("format", choices=["jsonl", "snapshot"])
+    parser.add_argument("out", help="output file (jsonl output is gzip compressed)")
+    parser.add_argument("--since", type=datetime.fromisoformat, default=None,
+                        help="only rows changed at/after this ISO timestamp")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.format == "jsonl":
+            with open(args.out, "wb") as out:
+                for chunk in iter_jsonl_gz(db, args.since):
+                    out.write(chunk)
+        else:
+            header = write_snapshot(db, args.out, args.since)
+            print({t: m["rows"] for t, m in header["tables"].items()})
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Audio fingerprints for near-duplicate detection (same recording under several music items).
+
+fingerprint(path):
+  1. ffmpeg decodes the first FINGERPRINT_SECONDS to mono PCM at SAMPLE_RATE (bounded size),
+  2. log magnitude spectrogram (Hann window, FRAME/HOP), one NumPy FFT over all frames,
+  3. spectral peaks: the strongest bin per frequency band and frame, kept when it stands
+     out of its band (PROMINENCE) and is above the band's median level - noise and
+     codec artefacts drop out, volume and EQ changes of a remaster don't matter much,
+  4. pairs of peaks with different frequencies (f1, f2, dt) hashed to 26 bit -
+     independent of absolute time, so a different lead-in or fade keeps the hashes,
+  5. MinHash over the set of pair hashes -> SIGNATURE_SIZE uint32 (504 bytes per track).
+The fraction of equal signature values estimates the Jaccard similarity of the hash sets.
+
+Signatures are indexed with LSH banding (BANDS bands of ROWS values, table
+fingerprint_bands): tracks that share at least one bucket are candidates, looked up via
+the index, and only those are compared - no scan over all signatures.
+
+NumPy is imported lazily - only the upload job computes fingerprints; indexing and
+lookups are plain Python.
+
+    python -m app.core.fingerprint     # fingerprint stored files uploaded before this existed
+"""
+import hashlib
+import struct
+import tempfile
+from typing import Optional
+
+from sqlalchemy import select, delete, and_, func, LargeBinary
+from sqlalchemy.orm import Session, aliased
+
+from app import models
+from app.core import transcoder
+from app.database import SessionLocal
+
+SAMPLE_RATE = 11025
+FINGERPRINT_SECONDS = 120
+FRAME = 1024
+HOP = 512
+FREQ_BANDS = 6  # peaks per frame
+PROMINENCE = 2.0  # min log magnitude of a peak above its band's mean
+FAN_OUT = 5  # pairs per anchor peak
+MAX_DT = 63  # frames between paired peaks (6 bits)
+SIGNATURE_SIZE = 126
+# Candidate probability 1 - (1 - s**ROWS)**BANDS: ~0.5% at similarity 0.05 (unrelated
+# tracks), 93% at 0.4, >99% from 0.5 (re-encodes ~0.95, remasters ~0.75)
+BANDS, ROWS = 42, 3  # BANDS * ROWS == SIGNATURE_SIZE
+MINHASH_BLOCK = 8192  # hashes per MinHash step, bounds the temporary matrix
+_PRIME = 4294967311  # > 2**32
+
+# MinHash functions h(x) = (a * x + b) % _PRIME. Derived from a hash of their index so
+# signatures stay comparable across NumPy versions and deployments.
+_COEFFS = [struct.unpack("<II", hashlib.blake2b(f"minhash-{i}".encode(), digest_size=8).digest()) for i in range(SIGNATURE_SIZE)]
+
+
+class FingerprintError(Exception):
+    pass
+
+
+def _peak_hashes(samples):
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    if len(samples) < FRAME * 4:
+        raise FingerprintError("audio too short to fingerprint")
+    frames = sliding_window_view(samples.astype(np.float32), FRAME)[::HOP] * np.hanning(FRAME).astype(np.float32)
+    spec = np.log1p(np.abs(np.fft.rfft(frames, axis=1)))  # (frames, FRAME // 2 + 1)
+
+    # strongest bin per (frame, log spaced band), roughly 90 Hz .. 5.5 kHz
+    edges = np.unique(np.geomspace(8, FRAME // 2, FREQ_BANDS + 1).astype(int))
+    times, freqs = [], []
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        band = spec[:, lo:hi]
+        peak = band.argmax(axis=1)
+        level = band[np.arange(len(band)), peak]
+        keep = (level > np.median(level)) & (level - band.mean(axis=1) > PROMINENCE)
+        times.append(np.nonzero(keep)[0])
+        freqs.append(peak[keep] + lo)
+    t = np.concatenate(times)
+    f = np.concatenate(freqs)  # < 512, 10 bits
+    order = np.lexsort((f, t))
+    t, f = t[order], f[order]
+
+    # pair every peak with the next FAN_OUT peaks inside MAX_DT frames; same frequency
+    # pairs (a sustained note) occur in every song and would only add false similarity
+    hashes = []
+    for d in range(1, FAN_OUT + 1):
+        dt = t[d:] - t[:-d]
+        ok = (dt > 0) & (dt <= MAX_DT) & (f[:-d] != f[d:])
+        hashes.append((f[:-d][ok].astype(np.uint32) << 16) | (f[d:][ok].astype(np.uint32) << 6) | dt[ok].astype(np.uint32))
+    hashes = np.unique(np.concatenate(hashes))
+    if not len(hashes):
+        raise FingerprintError("no spectral peaks (silence?)")
+    return hashes
+
+
+def _minhash(hashes) -> list[int]:
+    import numpy as np
+
+    a = np.array([c[0] >> 1 for c in _COEFFS], dtype=np.uint64)[:, None]  # < 2**31, a * x + b fits in 64 bit
+    b = np.array([c[1] for c in _COEFFS], dtype=np.uint64)[:, None]
+    sig = np.full(SIGNATURE_SIZE, np.iinfo(np.uint64).max, dtype=np.uint64)
+    for start in range(0, len(hashes), MINHASH_BLOCK):
+        x = hashes[start:start + MINHASH_BLOCK].astype(np.uint64)[None, :]
+        sig = np.minimum(sig, ((a * x + b) % _PRIME).min(axis=1))
+    return [int(v) & 0xFFFFFFFF for v in sig]
+
+
+def fingerprint(path: str) -> bytes:
+    """Signature of the audio file at path (SIGNATURE_SIZE little endian uint32)."""
+    try:
+        import numpy as np
+    except ImportError:
+        raise FingerprintError("numpy is not installed")
+    pcm = transcoder.decode_pcm(path, FINGERPRINT_SECONDS, SAMPLE_RATE)
+    return pack(_minhash(_peak_hashes(np.frombuffer(pcm, dtype="<i2"))))
+
+
+def pack(values: list[int]) -> bytes:
+    return struct.pack(f"<{SIGNATURE_SIZE}I", *values)
+
+
+def unpack(signature: bytes) -> tuple[int, ...]:
+    return struct.unpack(f"<{SIGNATURE_SIZE}I", signature)
+
+
+def similarity(a: bytes, b: bytes) -> float:
+    """Estimated Jaccard similarity of two signatures (0..1)."""
+    return sum(x == y for x, y in zip(unpack(a), unpack(b))) / SIGNATURE_SIZE
+
+
+def buckets(signature: bytes) -> list[tuple[int, int]]:
+    """(band, bucket) pairs for the LSH index. The bucket packs the band's ROWS values into a signed 63 bit int."""
+    values = unpack(signature)
+    result = []
+    for band in range(BANDS):
+        key = 0
+        for v in values[band * ROWS:(band + 1) * ROWS]:
+            key = (key * 0x9E3779B1 + v) & 0x7FFFFFFFFFFFFFFF
+        result.append((band, key))
+    return result
+
+
+def index_track(db: Session, track_id: int, signature: bytes):
+    """Store/replace the track's signature and its LSH buckets. Does not commit."""
+    db.execute(delete(models.TrackFingerprint).where(models.TrackFingerprint.track_id == track_id))
+    db.execute(delete(models.FingerprintBand).where(models.FingerprintBand.track_id == track_id))
+    db.add(models.TrackFingerprint(track_id=track_id, signature=signature))
+    db.flush()
+    db.add_all(models.FingerprintBand(band=band, bucket=bucket, track_id=track_id) for band, bucket in buckets(signature))
+    db.flush()  # sessions don't autoflush, find_duplicates must see the new buckets
+
+
+def find_duplicates(db: Session, track_id: int, min_similarity: float, limit: int = 20) -> Optional[list[tuple[int, str, float]]]:
+    """(track_id, title, similarity) of indexed tracks similar to track_id, best first.
+    None when track_id has no fingerprint."""
+    own = db.get(models.TrackFingerprint, track_id)
+    if own is None:
+        return None
+    mine, other = aliased(models.FingerprintBand), aliased(models.FingerprintBand)
+    # candidates share a bucket with the track (index lookups per band)
+    candidates = (select(other.track_id)
+                  .join(mine, and_(mine.band == other.band, mine.bucket == other.bucket))
+                  .where(mine.track_id == track_id, other.track_id != track_id)
+                  .distinct())
+    rows = db.execute(select(models.TrackFingerprint.track_id, models.TrackFingerprint.signature, models.MusicItem.title)
+                      .join(models.MusicItem, models.MusicItem.id == models.TrackFingerprint.track_id)
+                      .where(models.TrackFingerprint.track_id.in_(candidates))).all()
+    matches = [(tid, title, similarity(own.signature, sig)) for tid, sig, title in rows]
+    matches = [m for m in matches if m[2] >= min_similarity]
+    matches.sort(key=lambda m: -m[2])
+    return matches[:limit]
+
+
+def backfill(db: Session) -> int:
+    """Fingerprint stored track files that have no fingerprint yet. Returns the number indexed."""
+    tf = models.TrackFile
+    todo = db.scalars(select(tf.track_id).where(func.length(tf.file_data) > 0,
+                                                tf.track_id.not_in(select(models.TrackFingerprint.track_id)))).all()
+    done = 0
+    for track_id in todo:
+        # ffmpeg reads a file - copy the blob out in chunks instead of loading it whole
+        with tempfile.NamedTemporaryFile(suffix=".mp3") as tmp:
+            pos = 1
+            while chunk := db.execute(select(func.substr(tf.file_data, pos, transcoder.CHUNK_SIZE, type_=LargeBinary))
+                                      .where(tf.track_id == track_id)).scalar():
+                tmp.write(chunk)
+                pos += len(chunk)
+            tmp.flush()
+            try:
+                index_track(db, track_id, fingerprint(tmp.name))
+            except (FingerprintError, transcoder.TranscodeError) as e:
+                print(f"[fingerprint] track {track_id} skipped: {e}")
+                continue
+        db.commit()
+        done += 1
+    return done
+
+
+def main():
+    db = SessionLocal()
+    try:
+        print(f"fingerprinted {backfill(db)} tracks")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
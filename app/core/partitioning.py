@@ -0,0 +1,193 @@
+"""Optional Postgres hash partitioning for the two biggest tables.
+
+    user_collections  PARTITION BY HASH (user_id)        -> get_collection reads one partition
+    reviews           PARTITION BY HASH (music_item_id)  -> list_reviews_for_item reads one partition
+
+The ORM mappings don't change: partitioning is invisible to queries. Postgres requires
+the partition key in every primary key/unique constraint, so the reviews primary key
+becomes (id, music_item_id) in the database - id stays unique through its sequence and
+the mapper keeps using id alone. Lookups by review id alone (delete_review) probe every
+partition's index, which is fine for a single row.
+
+Conversion runs online, without a long lock:
+  1. create <table>__new with the target layout,
+  2. a trigger mirrors every insert/update/delete on <table> into <table>__new,
+  3. existing rows are copied in keyset batches of batch_size, each batch its own
+     transaction (rows are read FOR SHARE so a concurrent update waits for the batch
+     and is then mirrored by the trigger),
+  4. one short transaction drops the old table and renames <table>__new into place.
+Going back to a plain table is the same procedure with partitions=None.
+
+    alembic -x partitions=16 upgrade head        # during the migration
+    python -m app.core.partitioning 16           # or later, any time
+    python -m app.core.partitioning 0            # back to plain tables
+"""
+import argparse
+import time
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+# table -> partition key, primary key (of the partitioned / plain table), unique constraints, indexes, foreign keys
+# (names are the ones the existing tables carry, see models and migration c3d4e5f6a7b8)
+TABLES = {
+    "user_collections": dict(
+        key="user_id",
+        primary_key=["user_id", "music_item_id"],
+        unique={},
+        indexes={"ix_user_collections_updated_at": ["updated_at"]},
+        foreign_keys={"user_collections_user_id_fkey": ("user_id", "users", None),
+                      "fk_user_collections_item": ("music_item_id", "music_items", "CASCADE")},
+    ),
+    "reviews": dict(
+        key="music_item_id",
+        primary_key=["id", "music_item_id"],
+        plain_primary_key=["id"],
+        unique={"uq_review_user_item": ["user_id", "music_item_id"]},
+        indexes={"ix_reviews_user_id": ["user_id"], "ix_reviews_music_item_id": ["music_item_id"],
+                 "ix_reviews_updated_at": ["updated_at"]},
+        foreign_keys={"reviews_user_id_fkey": ("user_id", "users", None),
+                      "fk_reviews_item": ("music_item_id", "music_items", "CASCADE")},
+    ),
+}
+
+
+def partition_count(conn: Connection, table: str) -> Optional[int]:
+    """Number of hash partitions, None for a plain table."""
+    row = conn.execute(text(
+        "SELECT p.partrelid IS NOT NULL, (SELECT count(*) FROM pg_inherits i WHERE i.inhparent = c.oid) "
+        "FROM pg_class c LEFT JOIN pg_partitioned_table p ON p.partrelid = c.oid "
+        "WHERE c.oid = to_regclass(:t)"), {"t": table}).one()
+    return row[1] if row[0] else None
+
+
+def _primary_key(table: str, partitions: Optional[int]) -> list[str]:
+    spec = TABLES[table]
+    return spec["primary_key"] if partitions else spec.get("plain_primary_key", spec["primary_key"])
+
+
+def _prepare(conn: Connection, table: str, partitions: Optional[int]):
+    spec = TABLES[table]
+    new = f"{table}__new"
+    pk = ", ".join(_primary_key(table, partitions))
+    conn.execute(text(f"DROP TABLE IF EXISTS {new} CASCADE"))
+    partition_by = f" PARTITION BY HASH ({spec['key']})" if partitions else ""
+    conn.execute(text(f"CREATE TABLE {new} (LIKE {table} INCLUDING DEFAULTS){partition_by}"))
+    for i in range(partitions or 0):
+        conn.execute(text(f"CREATE TABLE {table}_h{partitions}_{i} PARTITION OF {new} "
+                          f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {i})"))
+    # constraints get their final names after the swap, until then they carry a __new suffix
+    conn.execute(text(f"ALTER TABLE {new} ADD CONSTRAINT {table}_pkey__new PRIMARY KEY ({pk})"))
+    for name, cols in spec["unique"].items():
+        conn.execute(text(f"ALTER TABLE {new} ADD CONSTRAINT {name}__new UNIQUE ({', '.join(cols)})"))
+    for name, cols in spec["indexes"].items():
+        conn.execute(text(f"CREATE INDEX {name}__new ON {new} ({', '.join(cols)})"))
+    for name, (col, ref, ondelete) in spec["foreign_keys"].items():
+        cascade = f" ON DELETE {ondelete}" if ondelete else ""
+        conn.execute(text(f"ALTER TABLE {new} ADD CONSTRAINT {name}__new FOREIGN KEY ({col}) REFERENCES {ref} (id){cascade}"))
+
+    # mirror writes on the old table while the copy runs (the partitioned key is unique in both layouts)
+    match = " AND ".join(f"{c} = OLD.{c}" for c in spec["primary_key"])
+    conn.execute(text(f"""
+        CREATE OR REPLACE FUNCTION {table}__sync() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM {new} WHERE {match};
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO {new} SELECT (NEW).* ON CONFLICT DO NOTHING;
+            END IF;
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql"""))
+    conn.execute(text(f"DROP TRIGGER IF EXISTS {table}__sync ON {table}"))
+    conn.execute(text(f"CREATE TRIGGER {table}__sync AFTER INSERT OR UPDATE OR DELETE ON {table} "
+                      f"FOR EACH ROW EXECUTE FUNCTION {table}__sync()"))
+
+
+def _copy(conn: Connection, table: str, batch_size: int, source_partitions: Optional[int]) -> int:
+    """Keyset batches in primary key order of the source table. conn must be in autocommit mode so every batch commits."""
+    cols = _primary_key(table, source_partitions)
+    key = ", ".join(cols)
+    key_desc = ", ".join(f"{c} DESC" for c in cols)
+    params = ", ".join(f":{c}" for c in cols)
+    last, copied = None, 0
+    while True:
+        where = "" if last is None else f"WHERE ({key}) > ({params})"
+        row = conn.execute(text(f"""
+            WITH batch AS (SELECT * FROM {table} {where} ORDER BY {key} LIMIT :n FOR SHARE),
+                 copied AS (INSERT INTO {table}__new SELECT * FROM batch ON CONFLICT DO NOTHING)
+            SELECT (SELECT count(*) FROM batch), {key} FROM batch ORDER BY {key_desc} LIMIT 1"""),
+            {"n": batch_size, **(last or {})}).one_or_none()
+        if row is None:
+            return copied
+        copied += row[0]
+        last = dict(zip(cols, row[1:]))
+        print(f"[partitioning] {table}: {copied} rows copied")
+
+
+def _swap(conn: Connection, table: str, lock_timeout: str = "5s"):
+    """Old table out, new table in under the final names. Runs in one short transaction."""
+    spec = TABLES[table]
+    new = f"{table}__new"
+    conn.execute(text(f"SET LOCAL lock_timeout = '{lock_timeout}'"))
+    conn.execute(text(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE"))
+    conn.execute(text(f"DROP TRIGGER {table}__sync ON {table}"))
+    conn.execute(text(f"DROP FUNCTION {table}__sync()"))
+    # serial sequences (reviews.id) are owned by the old table and would be dropped with it
+    for col in spec["primary_key"]:
+        seq = conn.execute(text("SELECT pg_get_serial_sequence(:t, :c)"), {"t": table, "c": col}).scalar()
+        if seq:
+            conn.execute(text(f"ALTER SEQUENCE {seq} OWNED BY {new}.{col}"))
+    conn.execute(text(f"DROP TABLE {table}"))  # partitions of a partitioned table go with it
+    conn.execute(text(f"ALTER TABLE {new} RENAME TO {table}"))
+    conn.execute(text(f"ALTER TABLE {table} RENAME CONSTRAINT {table}_pkey__new TO {table}_pkey"))
+    for name in spec["unique"]:
+        conn.execute(text(f"ALTER TABLE {table} RENAME CONSTRAINT {name}__new TO {name}"))
+    for name in spec["indexes"]:
+        conn.execute(text(f"ALTER INDEX {name}__new RENAME TO {name}"))
+    for name in spec["foreign_keys"]:
+        conn.execute(text(f"ALTER TABLE {table} RENAME CONSTRAINT {name}__new TO {name}"))
+
+
+def convert(conn: Connection, table: str, partitions: Optional[int], batch_size: int = 10_000) -> bool:
+    """Convert table to `partitions` hash partitions (None/0: plain table).
+    conn must be in autocommit mode. Returns False when the table already has that layout."""
+    partitions = partitions or None
+    current = partition_count(conn, table)
+    if current == partitions:
+        return False
+    start = time.perf_counter()
+    _prepare(conn, table, partitions)
+    copied = _copy(conn, table, batch_size, current)
+    # explicit transaction on the autocommit connection
+    conn.exec_driver_sql("BEGIN")
+    try:
+        _swap(conn, table)
+        conn.exec_driver_sql("COMMIT")
+    except Exception:
+        conn.exec_driver_sql("ROLLBACK")
+        raise
+    conn.execute(text(f"ANALYZE {table}"))
+    print(f"[partitioning] {table}: {copied} rows, {partitions or 'no'} partitions, {time.perf_counter() - start:.1f}s")
+    return True
+
+
+def main():
+    from app.database import engine
+
+    parser = argparse.ArgumentParser(description="Convert user_collections/reviews to hash partitions (0 = plain tables)")
+    parser.add_argument("partitions", type=int)
+    parser.add_argument("--tables", default=",".join(TABLES))
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    args = parser.parse_args()
+    if engine.dialect.name != "postgresql":
+        parser.error("partitioning needs Postgres")
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for table in args.tables.split(","):
+            if not convert(conn, table, args.partitions, args.batch_size):
+                print(f"[partitioning] {table}: already in that layout")
+
+
+if __name__ == "__main__":
+    main()
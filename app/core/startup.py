@@ -0,0 +1,43 @@
+import time
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.database import SessionLocal, warm_pool
+
+# Work done once per worker during lifespan so the first real request is not the slow one.
+
+
+def warm_statements():
+    """Run the hot read paths once with ids that cannot exist. This fills SQLAlchemy's
+    compiled statement cache (loader options included) without loading any data."""
+    from app.routers.music_items import get_music_item
+    from app.routers.collections import get_collection
+    from app.core.auth import USER_BY_ID
+
+    db = SessionLocal()
+    try:
+        db.execute(USER_BY_ID, {"user_id": -1})  # get_current_user
+        try:
+            get_music_item(-1, db)
+        except HTTPException:
+            pass
+        get_collection(-1, db)
+    finally:
+        db.close()
+
+
+def prewarm() -> dict:
+    timings = {}
+    t = time.perf_counter()
+    healthy = warm_pool(settings.db_prewarm_connections)
+    timings["pool_ms"] = int((time.perf_counter() - t) * 1000)
+    if healthy:
+        t = time.perf_counter()
+        try:
+            warm_statements()
+        except Exception as e:
+            print(f"[startup] statement warm-up failed: {e}")
+        timings["statements_ms"] = int((time.perf_counter() - t) * 1000)
+    print(f"[startup] {healthy}/{settings.db_prewarm_connections} connections ready, {timings}")
+    return timings
@@ -0,0 +1,216 @@
+"""Per-user listening profile statistics (table user_stats, see app/models/stats.py).
+
+Collection handlers call apply_collection_change() inside their transaction, which
+updates the user's single stats row from the old/new state of one entry. Changes
+that happen outside those handlers (an item's genres edited after it was collected,
+cascade deletes of items) are corrected by reconcile(), which recomputes rows in batches:
+
+    python -m app.core.stats              # all users
+    APP_STATS_RECONCILE_SECONDS=3600      # periodically inside the app (default, 0 = off)
+"""
+import argparse
+import asyncio
+from typing import Iterable, Optional
+
+from sqlalchemy import select, func, case, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import SessionLocal, engine
+
+# (preference, is_favourite) of a collection entry, None when the entry does not exist
+EntryState = Optional[tuple[str, bool]]
+
+
+def _empty(user_id: int) -> models.UserStats:
+    return models.UserStats(user_id=user_id, item_count=0, total_duration_seconds=0, like_count=0, dislike_count=0,
+                            favourite_count=0, genre_counts={}, artist_counts={}, favourite_decades={})
+
+
+def _bump(counts: dict, key, delta: int) -> dict:
+    # returns a new dict so SQLAlchemy notices the JSON change
+    counts = dict(counts or {})
+    key = str(key)
+    counts[key] = counts.get(key, 0) + delta
+    if counts[key] <= 0:
+        del counts[key]
+    return counts
+
+
+def decade_of(year: Optional[int]) -> Optional[int]:
+    return None if year is None else year // 10 * 10
+
+
+def apply_collection_change(db: Session, user_id: int, music_item_id: int, old: EntryState, new: EntryState):
+    """Apply the difference between old and new entry state to the user's stats row.
+    Does not commit - runs in the caller's transaction."""
+    if old == new:
+        return
+    stats = db.get(models.UserStats, user_id, with_for_update=True)
+    if stats is None:
+        try:
+            with db.begin_nested():
+                db.add(_empty(user_id))
+        except IntegrityError:
+            pass  # created concurrently by another request
+        stats = db.get(models.UserStats, user_id, with_for_update=True)
+
+    duration, year = db.execute(select(models.MusicItem.duration_seconds, models.MusicItem.release_year)
+                                .where(models.MusicItem.id == music_item_id)).one()
+
+    # membership: added or removed from the collection
+    if (old is None) != (new is None):
+        delta = 1 if new is not None else -1
+        stats.item_count += delta
+        stats.total_duration_seconds += delta * (duration or 0)
+        genre_counts, artist_counts = stats.genre_counts, stats.artist_counts
+        for gid in db.scalars(select(models.MusicItemGenre.genre_id).where(models.MusicItemGenre.music_item_id == music_item_id)):
+            genre_counts = _bump(genre_counts, gid, delta)
+        for aid in db.scalars(select(models.MusicItemArtist.artist_id).where(models.MusicItemArtist.music_item_id == music_item_id).distinct()):
+            artist_counts = _bump(artist_counts, aid, delta)
+        stats.genre_counts, stats.artist_counts = genre_counts, artist_counts
+
+    # preference / favourite: remove the old contribution, add the new one
+    for state, sign in ((old, -1), (new, 1)):
+        if state is None:
+            continue
+        preference, is_favourite = state
+        if preference == "LIKE":
+            stats.like_count += sign
+        elif preference == "DISLIKE":
+            stats.dislike_count += sign
+        if is_favourite:
+            stats.favourite_count += sign
+            if year is not None:
+                stats.favourite_decades = _bump(stats.favourite_decades, decade_of(year), sign)
+
+
+STAT_FIELDS = ("item_count", "total_duration_seconds", "like_count", "dislike_count", "favourite_count",
+               "genre_counts", "artist_counts", "favourite_decades")
+RECONCILE_BATCH = 500  # users per transaction
+_LOCK_KEY = 34_017  # pg advisory lock, one periodic reconcile at a time across workers
+
+
+def _aggregate(db: Session, user_ids: list[int]) -> dict[int, models.UserStats]:
+    """Stats of user_ids computed from user_collections with grouped queries (transient objects)."""
+    uc, mi = models.UserCollection, models.MusicItem
+    rows = {user_id: _empty(user_id) for user_id in user_ids}
+
+    totals = select(
+        uc.user_id, func.count(), func.coalesce(func.sum(mi.duration_seconds), 0),
+        func.sum(case((uc.preference == "LIKE", 1), else_=0)),
+        func.sum(case((uc.preference == "DISLIKE", 1), else_=0)),
+        func.sum(case((uc.is_favourite, 1), else_=0)),
+    ).join(mi, mi.id == uc.music_item_id).where(uc.user_id.in_(user_ids)).group_by(uc.user_id)
+    for user_id, count, duration, likes, dislikes, favourites in db.execute(totals):
+        s = rows[user_id]
+        s.item_count, s.total_duration_seconds = count, duration
+        s.like_count, s.dislike_count, s.favourite_count = likes or 0, dislikes or 0, favourites or 0
+
+    genres = (select(uc.user_id, models.MusicItemGenre.genre_id, func.count())
+              .join(models.MusicItemGenre, models.MusicItemGenre.music_item_id == uc.music_item_id)
+              .where(uc.user_id.in_(user_ids))
+              .group_by(uc.user_id, models.MusicItemGenre.genre_id))
+    for user_id, gid, count in db.execute(genres):
+        rows[user_id].genre_counts[str(gid)] = count
+
+    artists = (select(uc.user_id, models.MusicItemArtist.artist_id, func.count(func.distinct(uc.music_item_id)))
+               .join(models.MusicItemArtist, models.MusicItemArtist.music_item_id == uc.music_item_id)
+               .where(uc.user_id.in_(user_ids))
+               .group_by(uc.user_id, models.MusicItemArtist.artist_id))
+    for user_id, aid, count in db.execute(artists):
+        rows[user_id].artist_counts[str(aid)] = count
+
+    decade = (mi.release_year // 10) * 10
+    decades = (select(uc.user_id, decade, func.count())
+               .join(mi, mi.id == uc.music_item_id)
+               .where(uc.user_id.in_(user_ids), uc.is_favourite, mi.release_year.is_not(None))
+               .group_by(uc.user_id, decade))
+    for user_id, dec, count in db.execute(decades):
+        rows[user_id].favourite_decades[str(int(dec))] = count
+    return rows
+
+
+def _lock_rows(db: Session, user_ids: list[int]) -> dict[int, models.UserStats]:
+    """Stats rows of user_ids locked with SELECT ... FOR UPDATE (in user_id order), created where missing."""
+    stmt = (select(models.UserStats).where(models.UserStats.user_id.in_(user_ids))
+            .order_by(models.UserStats.user_id).with_for_update())
+    rows = {s.user_id: s for s in db.scalars(stmt)}
+    missing = [user_id for user_id in user_ids if user_id not in rows]
+    if not missing:
+        return rows
+    try:
+        with db.begin_nested():
+            db.add_all([_empty(user_id) for user_id in missing])
+    except IntegrityError:
+        # some were created concurrently by a collection handler (or the user does not exist)
+        for user_id in missing:
+            try:
+                with db.begin_nested():
+                    db.add(_empty(user_id))
+            except IntegrityError:
+                pass
+    return {s.user_id: s for s in db.scalars(stmt)}
+
+
+def reconcile(db: Session, user_ids: Optional[Iterable[int]] = None) -> int:
+    """Recompute stats rows from user_collections, RECONCILE_BATCH users per transaction.
+    Each batch locks its stats rows before reading the collections, like the handlers do: a
+    concurrent collection change either committed before (and is counted) or waits for the
+    lock and applies its delta on top - no increment is overwritten. Returns the number of rows written."""
+    if user_ids is None:
+        user_ids = db.scalars(select(models.User.id).order_by(models.User.id)).all()
+    else:
+        user_ids = sorted(set(user_ids))
+    written = 0
+    for i in range(0, len(user_ids), RECONCILE_BATCH):
+        batch = user_ids[i:i + RECONCILE_BATCH]
+        rows = _lock_rows(db, batch)
+        fresh = _aggregate(db, batch)
+        for user_id, stats in rows.items():
+            for field in STAT_FIELDS:
+                setattr(stats, field, getattr(fresh[user_id], field))
+        db.commit()
+        written += len(rows)
+    return written
+
+
+def _reconcile_all():
+    # session level advisory lock on its own connection: the batches commit (and may switch connections)
+    with engine.connect() as lock_conn:
+        postgres = engine.dialect.name == "postgresql"
+        if postgres and not lock_conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": _LOCK_KEY}).scalar():
+            return 0  # another worker is at it
+        db = SessionLocal()
+        try:
+            return reconcile(db)
+        finally:
+            db.close()
+            if postgres:
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _LOCK_KEY})
+                lock_conn.commit()
+
+
+async def reconcile_periodically(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(_reconcile_all)
+        except Exception as e:
+            print(f"[stats] reconcile failed: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute per-user collection statistics")
+    parser.add_argument("user_ids", nargs="*", type=int, help="only these users (default: all)")
+    args = parser.parse_args()
+    db = SessionLocal()
+    try:
+        print(f"reconciled {reconcile(db, args.user_ids or None)} users")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Streaming audio transcoder (ffmpeg subprocess).
+
+The upload is spooled to a temp file, ffprobe checks whether it already is the target
+format, and if not ffmpeg reads it from a stdin pipe and writes the result to a second
+temp file. The decoded PCM never lives in the API process; the encoded result (at most
+MAX_STORED_BYTES) is written into track_files.file_data with a single UPDATE - appending
+chunk by chunk would rewrite the whole TOAST value on every chunk.
+
+Each ffmpeg run is limited to one thread, APP_TRANSCODE_CPU_SECONDS of CPU time
+(RLIMIT_CPU via prlimit, Linux only) and APP_TRANSCODE_TIMEOUT_SECONDS of wall time.
+"""
+import json
+import os
+import subprocess
+import tempfile
+from typing import BinaryIO, Optional
+
+from sqlalchemy import update, select, func
+from sqlalchemy.orm import Session, aliased
+
+from app import models
+from app.core.config import settings
+
+try:
+    import resource  # POSIX only
+except ImportError:
+    resource = None
+
+CHUNK_SIZE = 1024 * 1024
+MAX_STORED_BYTES = 20_000_000  # same as the upload limit; a transcode must not grow past it
+TARGET_CODEC = "mp3"
+
+
+class TranscodeError(Exception):
+    pass
+
+
+def _bitrate(value: str) -> int:
+    # "64k" -> 64000
+    value = value.strip().lower()
+    return int(float(value[:-1]) * 1000) if value.endswith("k") else int(value)
+
+
+def _limit_resources(proc: subprocess.Popen):
+    # Set on the running child instead of via preexec_fn, which is not safe in a
+    # multithreaded process (Python code between fork and exec)
+    if resource is None or not hasattr(resource, "prlimit"):
+        return
+    cpu = int(settings.transcode_cpu_seconds)
+    try:
+        resource.prlimit(proc.pid, resource.RLIMIT_CPU, (cpu, cpu + 5))
+    except ProcessLookupError:
+        pass  # already exited
+
+
+def probe(path: str) -> Optional[tuple[str, Optional[int]]]:
+    """(codec, bit rate in bit/s) of the first audio stream, None when ffprobe can't read it."""
+    cmd = [settings.ffprobe_path, "-v", "error", "-select_streams", "a:0",
+           "-show_entries", "stream=codec_name,bit_rate:format=bit_rate", "-of", "json", path]
+    try:
+        out = subprocess.run(cmd, capture_output=True, timeout=30, check=True).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    info = json.loads(out or b"{}")
+    streams = info.get("streams") or []
+    if not streams:
+        return None
+    rate = streams[0].get("bit_rate") or info.get("format", {}).get("bit_rate")
+    return streams[0].get("codec_name"), int(rate) if rate else None
+
+
+def needs_transcode(path: str) -> bool:
+    probed = probe(path)
+    if probed is None:
+        raise TranscodeError("input is not a readable audio file")
+    codec, rate = probed
+    # already small enough MP3s are stored as uploaded
+    return not (codec == TARGET_CODEC and rate is not None and rate <= _bitrate(settings.transcode_bitrate) * 1.05)
+
+
+def transcode(src_path: str, dst: BinaryIO):
+    """Encode src_path to MP3 at the target bit rate into dst (an open binary file)."""
+    cmd = [settings.ffmpeg_path, "-nostdin", "-hide_banner", "-loglevel", "error", "-threads", "1",
+           "-i", "pipe:0", "-vn", "-map_metadata", "-1",
+           "-c:a", "libmp3lame", "-b:a", settings.transcode_bitrate, "-f", "mp3", "pipe:1"]
+    # stdin/stdout are OS level pipes to the files - nothing passes through Python buffers
+    with open(src_path, "rb") as src:
+        try:
+            proc = subprocess.Popen(cmd, stdin=src, stdout=dst, stderr=subprocess.PIPE)
+        except OSError as e:
+            raise TranscodeError(f"ffmpeg not available: {e}")
+        _limit_resources(proc)
+        try:
+            _, err = proc.communicate(timeout=settings.transcode_timeout_seconds)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            raise TranscodeError(f"timed out after {settings.transcode_timeout_seconds:g}s")
+    if proc.returncode != 0:
+        # negative return code: killed by a signal, SIGXCPU when the CPU limit was hit
+        raise TranscodeError(f"ffmpeg exited with {proc.returncode}: {err.decode(errors='replace')[-500:]}")
+
+
+def decode_pcm(src_path: str, seconds: float, rate: int) -> bytes:
+    """First `seconds` of src_path as mono signed 16 bit PCM at `rate` Hz (bounded: seconds * rate * 2 bytes)."""
+    cmd = [settings.ffmpeg_path, "-nostdin", "-hide_banner", "-loglevel", "error", "-threads", "1",
+           "-i", src_path, "-t", str(seconds), "-vn", "-ac", "1", "-ar", str(rate), "-f", "s16le", "pipe:1"]
+    try:
+        proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        raise TranscodeError(f"ffmpeg not available: {e}")
+    _limit_resources(proc)
+    try:
+        out, err = proc.communicate(timeout=settings.transcode_timeout_seconds)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.communicate()
+        raise TranscodeError(f"timed out after {settings.transcode_timeout_seconds:g}s")
+    if proc.returncode != 0:
+        raise TranscodeError(f"ffmpeg exited with {proc.returncode}: {err.decode(errors='replace')[-500:]}")
+    return out
+
+
+def store(db: Session, trackfile_id: int, src: BinaryIO) -> int:
+    """Write src (an open file, at most MAX_STORED_BYTES) into track_files.file_data with one UPDATE.
+    Runs in the caller's transaction, readers keep seeing the old data until commit.
+    Returns the number of bytes written."""
+    size = os.fstat(src.fileno()).st_size - src.tell()
+    if size > MAX_STORED_BYTES:
+        raise TranscodeError(f"result too large ({size} bytes, max {MAX_STORED_BYTES})")
+    tf = models.TrackFile
+    db.execute(update(tf).where(tf.id == trackfile_id).values(file_data=src.read()))
+    return size
+
+
+def copy_blob(db: Session, trackfile_id: int, source_track_id: int) -> int:
+    """Copy the stored file of source_track_id into the TrackFile row inside the database
+    (the blob never passes through the app). Does not commit. Returns the size."""
+    tf, source = models.TrackFile, aliased(models.TrackFile)
+    data = select(source.file_data).where(source.track_id == source_track_id).scalar_subquery()
+    db.execute(update(tf).where(tf.id == trackfile_id).values(file_data=data))
+    return db.execute(select(func.length(tf.file_data)).where(tf.id == trackfile_id)).scalar() or 0
+
+
+def transcode_to_blob(db: Session, trackfile_id: int, src_path: str) -> tuple[int, bool]:
+    """Transcode (or copy, when probe says it's already the target format) the file at
+    src_path into the TrackFile row. Does not commit. Returns (stored size, transcoded)."""
+    if not needs_transcode(src_path):
+        with open(src_path, "rb") as src:
+            return store(db, trackfile_id, src), False
+    # ffmpeg needs a real file descriptor for its stdout
+    with tempfile.TemporaryFile() as out:
+        transcode(src_path, out)
+        out.seek(0)
+        return store(db, trackfile_id, out), True
@@ -0,0 +1,202 @@
+"""Trending items (GET /music-items/trending) from time-bucketed popularity counters.
+
+Write path: the collection and review handlers call record() inside their transaction -
+one upsert adding the event's weight to the item's current hour bucket (item_popularity).
+Nothing ever scans user_collections or reviews to find what's hot.
+
+refresh() runs periodically (APP_TRENDING_REFRESH_SECONDS, or python -m app.core.trending):
+  1. compaction: hour buckets older than HOURLY_HOURS are folded into day buckets and
+     buckets older than the longest window are dropped, so the table stays at about
+     active items x (48 + 7) rows,
+  2. per window: score = sum(hits * 0.5 ** (age / half life)) over the window's buckets,
+     the TOP_N items overall and per genre replace that window's rows in trending_items.
+The route only reads the requested slice of trending_items (at most TOP_N rows).
+
+    python -m app.core.trending             # compact + recompute the top lists
+    python -m app.core.trending --backfill  # rebuild the counters from collection/review timestamps first
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import select, delete, insert, case, func, literal, literal_column, text, Integer, String
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app import models
+from app.core.stats import EntryState
+from app.database import SessionLocal
+
+# window -> (length, half life), both in hours
+WINDOWS = {"day": (24, 6), "week": (7 * 24, 48)}
+HOURLY_HOURS = 48  # hour buckets are kept this long, then folded into day buckets
+TOP_N = 100  # rows per window and genre in trending_items
+
+# event weights
+COLLECTED = 1.0
+LIKED = 1.0
+FAVOURITED = 2.0
+REVIEWED = 1.5
+
+_INSERT = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+_LOCK_KEY = 40_417  # pg advisory lock, one refresh at a time across workers
+
+
+def _hour(now: Optional[float] = None) -> int:
+    return int((time.time() if now is None else now) // 3600)
+
+
+def collection_weight(old: EntryState, new: EntryState) -> float:
+    """Weight of a collection change: being added, liked or favourited. Removals and
+    un-likes don't count against an item - trending measures recent interest."""
+    if new is None:
+        return 0.0
+    weight = COLLECTED if old is None else 0.0
+    if new[0] == "LIKE" and (old is None or old[0] != "LIKE"):
+        weight += LIKED
+    if new[1] and not (old and old[1]):
+        weight += FAVOURITED
+    return weight
+
+
+def record(db: Session, music_item_id: int, weight: float, now: Optional[float] = None):
+    """Add weight to the item's current hour bucket. Does not commit - runs in the caller's transaction."""
+    if weight <= 0:
+        return
+    ip = models.ItemPopularity.__table__
+    stmt = _INSERT[db.get_bind().dialect.name](ip).values(music_item_id=music_item_id, bucket=_hour(now), span=1, hits=weight)
+    db.execute(stmt.on_conflict_do_update(index_elements=["music_item_id", "bucket", "span"],
+                                          set_={"hits": ip.c.hits + stmt.excluded.hits}))
+
+
+def compact(db: Session, now: Optional[float] = None) -> int:
+    """Fold complete days of hour buckets older than HOURLY_HOURS into day buckets, drop
+    buckets outside every window. Does not commit. Returns the number of hour buckets folded."""
+    ip = models.ItemPopularity
+    hour = _hour(now)
+    cutoff = (hour - HOURLY_HOURS) // 24 * 24  # day boundary: only whole days are folded
+    day = ip.bucket // literal_column("24") * literal_column("24")
+    db.execute(insert(ip).from_select(
+        ["music_item_id", "bucket", "span", "hits"],
+        select(ip.music_item_id, day, literal(24, Integer), func.sum(ip.hits))
+        .where(ip.span == 1, ip.bucket < cutoff)
+        .group_by(ip.music_item_id, day)))
+    removed = db.execute(delete(ip).where(ip.span == 1, ip.bucket < cutoff)).rowcount
+    longest = max(length for length, _ in WINDOWS.values())
+    db.execute(delete(ip).where(ip.bucket < hour - longest - 24))
+    return removed
+
+
+def _top(window: str, per_item, by_genre: bool):
+    """INSERT .. SELECT of the TOP_N items by score, overall (genre 0) or per genre."""
+    mig = models.MusicItemGenre
+    order = (per_item.c.score.desc(), per_item.c.music_item_id)
+    if by_genre:
+        ranked = (select(mig.genre_id.label("genre_id"),
+                         func.row_number().over(partition_by=mig.genre_id, order_by=order).label("rank"),
+                         per_item.c.music_item_id, per_item.c.score)
+                  .join(mig, mig.music_item_id == per_item.c.music_item_id))
+    else:
+        ranked = select(literal(0, Integer).label("genre_id"), func.row_number().over(order_by=order).label("rank"),
+                        per_item.c.music_item_id, per_item.c.score)
+    ranked = ranked.subquery()
+    return insert(models.TrendingItem).from_select(
+        ["window", "genre_id", "rank", "music_item_id", "score"],
+        select(literal(window, String), ranked.c.genre_id, ranked.c.rank, ranked.c.music_item_id, ranked.c.score)
+        .where(ranked.c.rank <= TOP_N))
+
+
+def refresh(db: Session, now: Optional[float] = None) -> bool:
+    """Compact the counters and recompute trending_items in one transaction (readers keep
+    the previous lists until commit). Returns False when another worker is already at it."""
+    if db.get_bind().dialect.name == "postgresql" and not db.execute(
+            text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": _LOCK_KEY}).scalar():
+        return False
+    now = time.time() if now is None else now
+    compact(db, now)
+    ip = models.ItemPopularity
+    hours = now / 3600
+    for window, (length, half_life) in WINDOWS.items():
+        db.execute(delete(models.TrendingItem).where(models.TrendingItem.window == window))
+        start = _hour(now) - length + 1
+        # decay per bucket, measured from its middle; only a few dozen distinct buckets per window
+        weights = {bucket: 0.5 ** (max(hours - bucket - span / 2, 0) / half_life)
+                   for bucket, span in db.execute(select(ip.bucket, ip.span).where(ip.bucket >= start).distinct())}
+        if not weights:
+            continue
+        score = func.sum(ip.hits * case(weights, value=ip.bucket, else_=0.0))
+        per_item = (select(ip.music_item_id, score.label("score"))
+                    .where(ip.bucket >= start)
+                    .group_by(ip.music_item_id)
+                    .subquery())
+        db.execute(_top(window, per_item, by_genre=False))
+        db.execute(_top(window, per_item, by_genre=True))
+    db.commit()
+    return True
+
+
+def _timestamp(value: datetime) -> float:
+    # SQLite hands back naive UTC datetimes
+    return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+
+
+def backfill(db: Session, now: Optional[float] = None) -> int:
+    """Rebuild item_popularity from the created_at of collection entries and reviews inside
+    the longest window (current like/favourite state stands in for the original events).
+    Rows from before the created_at migration (NULL) are skipped. Returns the number of buckets written."""
+    now = time.time() if now is None else now
+    longest = max(length for length, _ in WINDOWS.values())
+    since = datetime.fromtimestamp(now - longest * 3600, tz=timezone.utc)
+    hits: dict[tuple[int, int], float] = {}
+    uc, r = models.UserCollection, models.Review
+    entries = db.execute(select(uc.music_item_id, uc.created_at, uc.preference, uc.is_favourite)
+                         .where(uc.created_at.is_not(None), uc.created_at >= since)).yield_per(10_000)
+    for item_id, created, preference, is_favourite in entries:
+        key = (item_id, _hour(_timestamp(created)))
+        hits[key] = hits.get(key, 0.0) + collection_weight(None, (preference, is_favourite))
+    reviews = select(r.music_item_id, r.created_at).where(r.created_at.is_not(None), r.created_at >= since)
+    for item_id, created in db.execute(reviews).yield_per(10_000):
+        key = (item_id, _hour(_timestamp(created)))
+        hits[key] = hits.get(key, 0.0) + REVIEWED
+    db.execute(delete(models.ItemPopularity))
+    if hits:
+        db.execute(insert(models.ItemPopularity), [{"music_item_id": item_id, "bucket": bucket, "span": 1, "hits": value}
+                                                   for (item_id, bucket), value in hits.items()])
+    db.commit()
+    return len(hits)
+
+
+def _refresh():
+    db = SessionLocal()
+    try:
+        return refresh(db)
+    finally:
+        db.close()
+
+
+async def refresh_periodically(interval: float):
+    while True:
+        try:
+            await asyncio.to_thread(_refresh)
+        except Exception as e:
+            print(f"[trending] refresh failed: {e}")
+        await asyncio.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact popularity counters and recompute trending items")
+    parser.add_argument("--backfill", action="store_true", help="rebuild the counters from collection/review timestamps first")
+    args = parser.parse_args()
+    db = SessionLocal()
+    try:
+        if args.backfill:
+            print(f"backfilled {backfill(db)} buckets")
+        print("refreshed" if refresh(db) else "skipped: another refresh is running")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
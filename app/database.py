@@ -1,8 +1,45 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text, event
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 from app.core.config import settings
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import Counter
+import threading
+
+# Pool settings only apply to the QueuePool used for Postgres (SQLite is used for local tests)
+_pool_args = {} if settings.database_url.startswith("sqlite") else {
+    "pool_size": settings.db_pool_size,
+    "max_overflow": settings.db_max_overflow,
+    "pool_timeout": settings.db_pool_timeout,
+}
+engine = create_engine(settings.database_url, echo=settings.echo_sql, pool_pre_ping=True, future=True,
+                       query_cache_size=settings.db_query_cache_size, **_pool_args)
+
+if settings.database_url.startswith("sqlite"):
+    # SQLite ignores foreign keys (and ON DELETE CASCADE) unless switched on per connection
+    @event.listens_for(engine, "connect")
+    def _sqlite_foreign_keys(dbapi_conn, _):
+        dbapi_conn.execute("PRAGMA foreign_keys=ON")
+
+if engine.dialect.driver == "psycopg":
+    # Server side prepared statements: Postgres parses and plans a repeated statement once
+    # instead of on every execution. psycopg deallocates them on every ROLLBACK (also the one
+    # ending a read-only session), so they last within a transaction and across committed ones.
+    @event.listens_for(engine, "connect")
+    def _psycopg_prepare(dbapi_conn, _):
+        threshold = settings.db_prepare_threshold
+        dbapi_conn.prepare_threshold = threshold if threshold >= 0 else None
+        dbapi_conn.prepared_max = settings.db_prepared_max
+
+# Compiled statement cache outcome per executed statement (CacheStats member -> count), per worker
+statement_cache_counts: Counter = Counter()
+statement_cache_lock = threading.Lock()
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count_statement_cache(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        with statement_cache_lock:
+            statement_cache_counts[context.cache_hit] += 1
 
-engine = create_engine(settings.database_url, echo=settings.echo_sql, pool_pre_ping=True, future=True)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 
 class Base(DeclarativeBase):
@@ -19,3 +56,37 @@ def init_db():
     # Import models so metadata is populated
     from app.models.user import User
     from app.models.music import Artist, Genre, MusicItem, MusicItemArtist, MusicItemGenre, Review, UserCollection, AlbumTrack, TrackFile
+    from app.models.stats import UserStats
+    from app.models.fingerprint import TrackFingerprint, FingerprintBand
+    from app.models.trending import ItemPopularity, TrendingItem
+
+def warm_pool(n: int) -> int:
+    """Open n pooled connections in parallel and health check them with SELECT 1.
+    They go back into the pool afterwards, so the first requests find them ready.
+    Returns the number of healthy connections."""
+    n = min(n, settings.db_pool_size)
+    if n <= 0:
+        return 0
+
+    # every worker keeps its connection until all have connected, otherwise the pool would
+    # simply hand the first (already returned) connection out again
+    barrier = threading.Barrier(n)
+
+    def check(_):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            try:
+                barrier.wait(timeout=30)
+            except threading.BrokenBarrierError:
+                pass  # another check failed; this connection is still healthy
+
+    ok = 0
+    with ThreadPoolExecutor(max_workers=n) as ex:
+        for f in as_completed([ex.submit(check, i) for i in range(n)]):
+            try:
+                f.result()
+                ok += 1
+            except Exception as e:
+                barrier.abort()
+                print(f"[startup] connection health check failed: {e}")
+    return ok
@@ -1,2 +1,5 @@
 from .user import *
-from .music import *
\ No newline at end of file
+from .music import *
+from .stats import *
+from .fingerprint import *
+from .trending import *
@@ -0,0 +1,23 @@
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import ForeignKey, LargeBinary, SmallInteger, BigInteger, DateTime, Index, func
+from app.database import Base
+from typing import Optional
+from datetime import datetime
+
+class TrackFingerprint(Base):
+    """MinHash signature of a track's spectral peak hashes (see app/core/fingerprint.py).
+    signature holds SIGNATURE_SIZE little endian uint32 values."""
+    __tablename__ = "track_fingerprints"
+    track_id: Mapped[int] = mapped_column(ForeignKey("music_items.id", ondelete="CASCADE"), primary_key=True)
+    signature: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+class FingerprintBand(Base):
+    """LSH index: one row per (band, bucket) of a signature. Tracks sharing any bucket are
+    duplicate candidates, found through the primary key index instead of comparing all signatures."""
+    __tablename__ = "fingerprint_bands"
+    band: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    bucket: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    track_id: Mapped[int] = mapped_column(ForeignKey("track_fingerprints.track_id", ondelete="CASCADE"), primary_key=True)
+
+    __table_args__ = (Index("ix_fingerprint_bands_track_id", "track_id"),)
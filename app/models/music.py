@@ -3,6 +3,7 @@ from sqlalchemy import String, ForeignKey, Boolean, Text, Integer, LargeBinary,
 from sqlalchemy import UniqueConstraint
 from app.database import Base
 from typing import Optional
+from datetime import datetime
 
 class Artist(Base):
     __tablename__ = "artists"
@@ -25,20 +26,24 @@ class MusicItem(Base):
     item_type: Mapped[str] = mapped_column(String(16), default="TRACK")  # TRACK | ALBUM | OTHER
     release_year: Mapped[Optional[int]] = mapped_column(nullable=True)
     duration_seconds: Mapped[Optional[int]] = mapped_column(nullable=True)
-
-    artists = relationship("MusicItemArtist", back_populates="music_item", cascade="all, delete-orphan")
-    genres = relationship("MusicItemGenre", back_populates="music_item", cascade="all, delete-orphan")
-    reviews = relationship("Review", back_populates="music_item", cascade="all, delete-orphan")
-    collectors = relationship("UserCollection", back_populates="music_item", cascade="all, delete-orphan")
+    # bumped on every change (incl. artist/genre/track list edits), used by incremental exports
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
+
+    # Child rows are removed by ON DELETE CASCADE in the database (passive_deletes) -
+    # deleting an item must not load reviews, collections or the audio blob into memory.
+    artists = relationship("MusicItemArtist", back_populates="music_item", cascade="all, delete-orphan", passive_deletes=True)
+    genres = relationship("MusicItemGenre", back_populates="music_item", cascade="all, delete-orphan", passive_deletes=True)
+    reviews = relationship("Review", back_populates="music_item", cascade="all, delete-orphan", passive_deletes=True)
+    collectors = relationship("UserCollection", back_populates="music_item", cascade="all, delete-orphan", passive_deletes=True)
     # Album <-> Track relationship (self-referential through AlbumTrack)
-    album_tracks = relationship("AlbumTrack", back_populates="album", cascade="all, delete-orphan", foreign_keys="AlbumTrack.album_id", order_by="AlbumTrack.track_number")
-    track_albums = relationship("AlbumTrack", back_populates="track", cascade="all, delete-orphan", foreign_keys="AlbumTrack.track_id")
+    album_tracks = relationship("AlbumTrack", back_populates="album", cascade="all, delete-orphan", passive_deletes=True, foreign_keys="AlbumTrack.album_id", order_by="AlbumTrack.track_number")
+    track_albums = relationship("AlbumTrack", back_populates="track", cascade="all, delete-orphan", passive_deletes=True, foreign_keys="AlbumTrack.track_id")
     # Optional binary file attached to a track
-    track_file = relationship("TrackFile", back_populates="track", uselist=False, cascade="all, delete-orphan")
+    track_file = relationship("TrackFile", back_populates="track", uselist=False, cascade="all, delete-orphan", passive_deletes=True)
 
 class MusicItemArtist(Base):
     __tablename__ = "music_item_artists"
-    music_item_id: Mapped[int] = mapped_column(ForeignKey("music_items.id"), primary_key=True)
+    music_item_id: Mapped[int] = mapped_column(ForeignKey("music_items.id", ondelete="CASCADE"), primary_key=True)
     artist_id: Mapped[int] = mapped_column(ForeignKey("artists.id"), primary_key=True)
     role: Mapped[str] = mapped_column(String(20), default="PRIMARY", primary_key=True) # PRIMARY | FEATURED | PRODUCER ...
 
@@ -47,7 +52,7 @@ class MusicItemArtist(Base):
 
 class MusicItemGenre(Base):
     __tablename__ = "music_item_genres"
-    music_item_id: Mapped[int] = mapped_column(ForeignKey("music_items.id"), primary_key=True)
+    music_item_id: Mapped[int] = mapped_column(ForeignKey("music_items.id", ondelete="CASCADE"), primary_key=True)
     genre_id: Mapped[int] = mapped_column(ForeignKey("genres.id"), primary_key=True)
 
     music_item = relationship("MusicItem", back_populates="genres")
@@ -57,22 +62,28 @@ class Review(Base):
     __tablename__ = "reviews"
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
-    music_item_id: Mapped[int] = mapped_column(ForeignKey("music_items.id"), index=True)
+    music_item_id: Mapped[int] = mapped_column(ForeignKey("music_items.id", ondelete="CASCADE"), index=True)
     rating: Mapped[Optional[int]] = mapped_column(nullable=True)  # 1..5
     text: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
 
     user = relationship("User", back_populates="reviews")
     music_item = relationship("MusicItem", back_populates="reviews")
 
+    # Optionally hash partitioned on music_item_id in Postgres (app/core/partitioning.py);
+    # the database primary key is then (id, music_item_id), the mapping stays on id
     __table_args__ = (UniqueConstraint("user_id", "music_item_id", name="uq_review_user_item"),)
 
 class UserCollection(Base):
     __tablename__ = "user_collections"
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
-    music_item_id: Mapped[int] = mapped_column(ForeignKey("music_items.id"), primary_key=True)
+    music_item_id: Mapped[int] = mapped_column(ForeignKey("music_items.id", ondelete="CASCADE"), primary_key=True)
     preference: Mapped[str] = mapped_column(String(10), default="NONE")  # LIKE | DISLIKE | NONE
     is_favourite: Mapped[bool] = mapped_column(Boolean, default=False)
     note: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())  # when the item was collected
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
 
     user = relationship("User", back_populates="collections")
     music_item = relationship("MusicItem", back_populates="collectors")
@@ -82,8 +93,8 @@ class AlbumTrack(Base):
     A track can appear in multiple albums. Only admins may manage this mapping.
     """
     __tablename__ = "album_tracks"
-    album_id: Mapped[int] = mapped_column(ForeignKey("music_items.id"), primary_key=True)
-    track_id: Mapped[int] = mapped_column(ForeignKey("music_items.id"), primary_key=True)
+    album_id: Mapped[int] = mapped_column(ForeignKey("music_items.id", ondelete="CASCADE"), primary_key=True)
+    track_id: Mapped[int] = mapped_column(ForeignKey("music_items.id", ondelete="CASCADE"), primary_key=True)
     track_number: Mapped[int] = mapped_column(Integer, default=0)
 
     album = relationship("MusicItem", foreign_keys=[album_id], back_populates="album_tracks")
@@ -93,10 +104,10 @@ class AlbumTrack(Base):
 class TrackFile(Base):
     __tablename__ = "track_files"
     id: Mapped[int] = mapped_column(primary_key=True)
-    track_id: Mapped[int] = mapped_column(ForeignKey("music_items.id"), unique=True, index=True)
+    track_id: Mapped[int] = mapped_column(ForeignKey("music_items.id", ondelete="CASCADE"), unique=True, index=True)
     filename: Mapped[Optional[str]] = mapped_column(String(500), nullable=False)
     content_type: Mapped[Optional[str]] = mapped_column(String(120), nullable=True)
-    file_data: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=False)
+    file_data: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=False, deferred=True)  # only loaded on access / undefer()
     compressed: Mapped[bool] = mapped_column(Boolean, default=True)
     original_size: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     created_at: Mapped[Optional[str]] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,21 @@
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import ForeignKey, Integer, JSON, DateTime, func
+from app.database import Base
+from typing import Optional
+from datetime import datetime
+
+class UserStats(Base):
+    """Pre-aggregated listening profile per user (one row, read by GET /users/{id}/stats).
+    Kept up to date incrementally by the collection handlers, corrected by app.core.stats.reconcile.
+    The *_counts columns map id (as string, JSON keys) -> number of collected items."""
+    __tablename__ = "user_stats"
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    item_count: Mapped[int] = mapped_column(Integer, default=0)
+    total_duration_seconds: Mapped[int] = mapped_column(Integer, default=0)
+    like_count: Mapped[int] = mapped_column(Integer, default=0)
+    dislike_count: Mapped[int] = mapped_column(Integer, default=0)
+    favourite_count: Mapped[int] = mapped_column(Integer, default=0)
+    genre_counts: Mapped[dict] = mapped_column(JSON, default=dict)
+    artist_counts: Mapped[dict] = mapped_column(JSON, default=dict)
+    favourite_decades: Mapped[dict] = mapped_column(JSON, default=dict)  # "1990" -> favourites released in the 90s
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,27 @@
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import ForeignKey, Integer, SmallInteger, String, Float, Index
+from app.database import Base
+
+class ItemPopularity(Base):
+    """Weighted collection/review events per item and time bucket (see app/core/trending.py).
+    bucket is the start in hours since the epoch (UTC), span its length in hours:
+    1 for recent buckets, 24 once compacted into days."""
+    __tablename__ = "item_popularity"
+    music_item_id: Mapped[int] = mapped_column(ForeignKey("music_items.id", ondelete="CASCADE"), primary_key=True)
+    bucket: Mapped[int] = mapped_column(Integer, primary_key=True)
+    span: Mapped[int] = mapped_column(SmallInteger, primary_key=True, default=1)
+    hits: Mapped[float] = mapped_column(Float, default=0.0)
+
+    __table_args__ = (Index("ix_item_popularity_bucket", "bucket"),)
+
+class TrendingItem(Base):
+    """Precomputed top items per window and genre (genre_id 0 = all genres), at most
+    trending.TOP_N rows each. Replaced by app.core.trending.refresh."""
+    __tablename__ = "trending_items"
+    window: Mapped[str] = mapped_column(String(8), primary_key=True)  # day | week
+    genre_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    rank: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    music_item_id: Mapped[int] = mapped_column(ForeignKey("music_items.id", ondelete="CASCADE"))
+    score: Mapped[float] = mapped_column(Float)
+
+    music_item = relationship("MusicItem")
@@ -4,10 +4,12 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app import models, schemas
 from app.core.auth import require_admin, get_current_user
+from app.core.budgets import query_budget
 
 router = APIRouter()
 
 @router.post("", response_model=schemas.ArtistOut, status_code=201, dependencies=[Depends(require_admin)])
+@query_budget(queries=3, ms=100)
 def create_artist(payload: schemas.ArtistCreate, db: Session = Depends(get_db)):
     artist = models.Artist(name=payload.name)
     db.add(artist)
@@ -16,5 +18,6 @@ def create_artist(payload: schemas.ArtistCreate, db: Session = Depends(get_db)):
     return artist
 
 @router.get("", response_model=list[schemas.ArtistOut])
+@query_budget(queries=1, ms=250)
 def list_artists(db: Session = Depends(get_db)):
     return db.query(models.Artist).all()
\ No newline at end of file
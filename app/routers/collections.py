@@ -1,12 +1,23 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select, bindparam
 from sqlalchemy.orm import Session, selectinload
 
 from app.database import get_db
 from app import models, schemas
 from app.core.auth import get_current_user
+from app.core.events import hub
+from app.core.admission import limit
+from app.core.stats import apply_collection_change
+from app.core import trending
+from app.core.budgets import query_budget
+from app.routers.music_items import ITEM_LOADERS
 
 router = APIRouter()
 
+COLLECTION = (select(models.UserCollection)
+              .options(selectinload(models.UserCollection.music_item).options(*ITEM_LOADERS))
+              .where(models.UserCollection.user_id == bindparam("user_id")))
+
 # /users/{user_id}/collection
 def _serialize_collection_entry(entry: models.UserCollection) -> schemas.CollectionEntryOut:
     mi = entry.music_item
@@ -22,17 +33,14 @@ def _serialize_collection_entry(entry: models.UserCollection) -> schemas.Collect
         music_item=enriched,
     )
 
-@router.get("/{user_id}/collection", response_model=list[schemas.CollectionEntryOut])
+@router.get("/{user_id}/collection", response_model=list[schemas.CollectionEntryOut], dependencies=[Depends(limit("get_collection", rate=2, burst=10))])
+@query_budget(queries=12, ms=250)
 def get_collection(user_id: int, db: Session = Depends(get_db)):
-    entries = db.query(models.UserCollection).options(
-        selectinload(models.UserCollection.music_item).selectinload(models.MusicItem.artists).selectinload(models.MusicItemArtist.artist),
-        selectinload(models.UserCollection.music_item).selectinload(models.MusicItem.genres).selectinload(models.MusicItemGenre.genre),
-        selectinload(models.UserCollection.music_item).selectinload(models.MusicItem.album_tracks).selectinload(models.AlbumTrack.track).selectinload(models.MusicItem.artists).selectinload(models.MusicItemArtist.artist),
-        selectinload(models.UserCollection.music_item).selectinload(models.MusicItem.album_tracks).selectinload(models.AlbumTrack.track).selectinload(models.MusicItem.genres).selectinload(models.MusicItemGenre.genre),
-    ).filter(models.UserCollection.user_id == user_id).all()
+    entries = db.execute(COLLECTION, {"user_id": user_id}).scalars().all()
     return [_serialize_collection_entry(e) for e in entries]
 
 @router.post("/{user_id}/collection/{music_item_id}", status_code=201)
+@query_budget(queries=15, ms=150)
 def add_to_collection(user_id: int, music_item_id: int, db: Session = Depends(get_db), user: models.User = Depends(get_current_user)):
     if user.id != user_id and user.role != "ADMIN":
         raise HTTPException(status_code=403, detail="Cannot modify another user's collection")
@@ -42,13 +50,17 @@ def add_to_collection(user_id: int, music_item_id: int, db: Session = Depends(ge
     existing = db.query(models.UserCollection).filter_by(user_id=user_id, music_item_id=music_item_id).one_or_none()
     if existing:
         return existing
-    entry = models.UserCollection(user_id=user_id, music_item_id=music_item_id)
+    entry = models.UserCollection(user_id=user_id, music_item_id=music_item_id, preference="NONE", is_favourite=False)
     db.add(entry)
+    apply_collection_change(db, user_id, music_item_id, None, (entry.preference, entry.is_favourite))
+    trending.record(db, music_item_id, trending.collection_weight(None, (entry.preference, entry.is_favourite)))
     db.commit()
     db.refresh(entry)
+    hub.publish("collection.changed", user_id=user_id, music_item_id=music_item_id, action="added")
     return entry
 
 @router.patch("/{user_id}/collection/{music_item_id}")
+@query_budget(queries=8, ms=100)
 def update_collection_entry(user_id: int, music_item_id: int, payload: schemas.CollectionUpsert,
                             db: Session = Depends(get_db), user: models.User = Depends(get_current_user)):
     if user.id != user_id and user.role != "ADMIN":
@@ -56,19 +68,49 @@ def update_collection_entry(user_id: int, music_item_id: int, payload: schemas.C
     entry = db.query(models.UserCollection).filter_by(user_id=user_id, music_item_id=music_item_id).one_or_none()
     if not entry:
         raise HTTPException(status_code=404, detail="Collection entry not found")
+    before = (entry.preference, entry.is_favourite)
     for field, value in payload.model_dump(exclude_unset=True).items():
         setattr(entry, field, value)
+    apply_collection_change(db, user_id, music_item_id, before, (entry.preference, entry.is_favourite))
+    trending.record(db, music_item_id, trending.collection_weight(before, (entry.preference, entry.is_favourite)))
     db.commit()
     db.refresh(entry)
+    hub.publish("collection.changed", user_id=user_id, music_item_id=music_item_id, action="updated")
     return entry
 
 @router.delete("/{user_id}/collection/{music_item_id}", status_code=204)
+@query_budget(queries=8, ms=100)
 def remove_from_collection(user_id: int, music_item_id: int, db: Session = Depends(get_db), user: models.User = Depends(get_current_user)):
     if user.id != user_id and user.role != "ADMIN":
         raise HTTPException(status_code=403, detail="Cannot modify another user's collection")
     entry = db.query(models.UserCollection).filter_by(user_id=user_id, music_item_id=music_item_id).one_or_none()
     if not entry:
         return
+    apply_collection_change(db, user_id, music_item_id, (entry.preference, entry.is_favourite), None)
     db.delete(entry)
     db.commit()
-    return
\ No newline at end of file
+    hub.publish("collection.changed", user_id=user_id, music_item_id=music_item_id, action="removed")
+    return
+
+@router.get("/{user_id}/stats", response_model=schemas.UserStatsOut)
+@query_budget(queries=2, ms=50)
+def get_user_stats(user_id: int, db: Session = Depends(get_db)):
+    # Single row read; rows are maintained by the handlers above (and app.core.stats.reconcile)
+    stats = db.get(models.UserStats, user_id)
+    if stats is None:
+        if not db.get(models.User, user_id):
+            raise HTTPException(status_code=404, detail="User not found")
+        return schemas.UserStatsOut(user_id=user_id)
+    rated = stats.like_count + stats.dislike_count
+    return schemas.UserStatsOut(
+        user_id=user_id,
+        item_count=stats.item_count,
+        total_duration_seconds=stats.total_duration_seconds,
+        like_count=stats.like_count,
+        dislike_count=stats.dislike_count,
+        like_ratio=stats.like_count / rated if rated else None,
+        favourite_count=stats.favourite_count,
+        genre_counts=stats.genre_counts,
+        artist_counts=stats.artist_counts,
+        favourite_decades=stats.favourite_decades,
+    )
@@ -0,0 +1,68 @@
+import asyncio
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+
+from app.core.events import hub
+
+router = APIRouter()
+
+KEEPALIVE_SECONDS = 15
+
+
+def _parse_types(types: Optional[str]) -> Optional[set[str]]:
+    # ?types=track_file,collection.changed
+    if not types:
+        return None
+    return {t.strip() for t in types.split(",") if t.strip()}
+
+
+@router.get("/stream")
+async def stream_events(request: Request, types: Optional[str] = Query(default=None, description="Comma separated event types or prefixes")):
+    """Server-Sent Events. Event types: track_file.ready, track_file.failed,
+    music_item.created, music_item.updated, music_item.deleted, collection.changed
+    (music_item.deleted from a bulk delete carries music_item_ids instead of music_item_id)"""
+    sub = hub.subscribe(_parse_types(types))
+
+    async def gen():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(sub.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+        finally:
+            hub.unsubscribe(sub)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(gen(), media_type="text/event-stream", headers=headers)
+
+
+@router.websocket("/ws")
+async def websocket_events(websocket: WebSocket, types: Optional[str] = None):
+    await websocket.accept()
+    sub = hub.subscribe(_parse_types(types))
+
+    async def wait_disconnect():
+        # Clients don't send anything; we only read to notice when they go away
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    closed = asyncio.create_task(wait_disconnect())
+    try:
+        while not closed.done():
+            getter = asyncio.create_task(sub.get())
+            await asyncio.wait({getter, closed}, return_when=asyncio.FIRST_COMPLETED)
+            if not getter.done():
+                getter.cancel()
+                break
+            await websocket.send_json(getter.result())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        closed.cancel()
+        hub.unsubscribe(sub)
@@ -0,0 +1,47 @@
+import os
+import tempfile
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query, BackgroundTasks
+from fastapi.responses import StreamingResponse, FileResponse
+from sqlalchemy.orm import Session
+
+from app.core.auth import require_admin
+from app.core.export import iter_jsonl_gz, write_snapshot
+from app.database import SessionLocal, get_db
+from app.core.budgets import query_budget
+
+router = APIRouter()
+
+
+@router.get("/export", dependencies=[Depends(require_admin)])
+@query_budget(queries=9, ms=500)
+def export_catalog(background: BackgroundTasks,
+                   format: str = Query(default="jsonl", pattern="^(jsonl|snapshot)$"),
+                   since: Optional[datetime] = Query(default=None, description="Only rows changed at/after this time"),
+                   db: Session = Depends(get_db)):
+    # db is the session require_admin authenticated with. get_db only closes it after the
+    # whole response has been sent, so release its connection now; the export uses its own
+    db.close()
+    stamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    if format == "jsonl":
+        def stream():
+            export_db = SessionLocal()
+            try:
+                yield from iter_jsonl_gz(export_db, since)
+            finally:
+                export_db.close()
+        headers = {"Content-Disposition": f"attachment; filename=\"catalog-{stamp}.jsonl.gz\""}
+        return StreamingResponse(stream(), media_type="application/gzip", headers=headers)
+
+    # Columnar snapshot needs its column offsets up front, so it is built in a temp file first
+    fd, path = tempfile.mkstemp(suffix=".snap")
+    os.close(fd)
+    export_db = SessionLocal()
+    try:
+        write_snapshot(export_db, path, since)
+    finally:
+        export_db.close()
+    background.add_task(os.remove, path)
+    return FileResponse(path, media_type="application/octet-stream", filename=f"catalog-{stamp}.snap")
@@ -4,10 +4,12 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app import models, schemas
 from app.core.auth import require_admin
+from app.core.budgets import query_budget
 
 router = APIRouter()
 
 @router.post("", response_model=schemas.GenreOut, status_code=201, dependencies=[Depends(require_admin)])
+@query_budget(queries=3, ms=100)
 def create_genre(payload: schemas.GenreCreate, db: Session = Depends(get_db)):
     genre = models.Genre(name=payload.name)
     db.add(genre)
@@ -16,5 +18,6 @@ def create_genre(payload: schemas.GenreCreate, db: Session = Depends(get_db)):
     return genre
 
 @router.get("", response_model=list[schemas.GenreOut])
+@query_budget(queries=1, ms=100)
 def list_genres(db: Session = Depends(get_db)):
     return db.query(models.Genre).all()
\ No newline at end of file
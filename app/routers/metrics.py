@@ -0,0 +1,33 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy import text
+from sqlalchemy.engine.interfaces import CacheStats
+from sqlalchemy.orm import Session
+
+from app.core.auth import require_admin
+from app.core.budgets import query_budget
+from app.core.config import settings
+from app.database import get_db, engine, statement_cache_counts, statement_cache_lock
+
+router = APIRouter()
+
+
+@router.get("/statement-cache", dependencies=[Depends(require_admin)])
+@query_budget(queries=2, ms=50)
+def statement_cache(db: Session = Depends(get_db)):
+    """SQLAlchemy compiled statement cache of this worker since start, and on Postgres the
+    server side prepared statements of the connection serving this request."""
+    with statement_cache_lock:
+        counts = {stat.name.lower(): statement_cache_counts[stat] for stat in CacheStats}
+    lookups = counts["cache_hit"] + counts["cache_miss"]
+    result = {
+        "statements": counts,
+        "hit_rate": round(counts["cache_hit"] / lookups, 4) if lookups else None,
+        "cache_size": settings.db_query_cache_size,
+    }
+    if engine.dialect.driver == "psycopg":
+        # generic plans: executions that skipped planning altogether
+        count, generic, custom = db.execute(text(
+            "SELECT count(*), coalesce(sum(generic_plans), 0), coalesce(sum(custom_plans), 0) FROM pg_prepared_statements")).one()
+        result["prepared"] = {"threshold": settings.db_prepare_threshold, "max": settings.db_prepared_max,
+                              "statements": count, "generic_plans": generic, "custom_plans": custom}
+    return result
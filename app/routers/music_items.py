@@ -1,14 +1,47 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session, selectinload
 
 from app.database import get_db
 from app import models, schemas
-from app.core.auth import require_admin
-from sqlalchemy import func
+from app.core.auth import require_admin, get_current_user
+from app.core.events import hub
+from app.core.admission import limit
+from app.core.catalog_index import catalog_index
+from app.core.album_stream import album_segments, parse_range, iter_range
+from app.core import trending
+from sqlalchemy import func, delete, select, bindparam, lambda_stmt
 
+from app.core.budgets import query_budget
 
 router = APIRouter()
 
+# AlbumTrack.track_number is a sparse ordering key (1024, 2048, ...), not the displayed number.
+# Inserting/moving a track picks a key between its neighbours; only when there is no
+# gap left the album is renumbered (see patch_album_tracks).
+TRACK_NUMBER_GAP = 1024
+DELETED_EVENT_BATCH = 500  # ids per music_item.deleted event of a bulk delete
+
+# Loader options of a fully serialized item (artists, genres, album tracks with theirs).
+# The hot read paths use statements built once from these: a prebuilt statement keeps its
+# cache key memoized, rebuilding db.query(...).options(...) costs ~0.7 ms CPU per request
+# just to construct the option chain and compute its cache key.
+ITEM_LOADERS = (
+    selectinload(models.MusicItem.artists).selectinload(models.MusicItemArtist.artist),
+    selectinload(models.MusicItem.genres).selectinload(models.MusicItemGenre.genre),
+    selectinload(models.MusicItem.album_tracks).selectinload(models.AlbumTrack.track).options(
+        selectinload(models.MusicItem.artists).selectinload(models.MusicItemArtist.artist),
+        selectinload(models.MusicItem.genres).selectinload(models.MusicItemGenre.genre),
+    ),
+)
+ITEMS = select(models.MusicItem).options(*ITEM_LOADERS)
+ITEM_BY_ID = ITEMS.where(models.MusicItem.id == bindparam("item_id"))
+TRENDING = (select(models.TrendingItem)
+            .options(selectinload(models.TrendingItem.music_item).options(*ITEM_LOADERS))
+            .where(models.TrendingItem.window == bindparam("window"), models.TrendingItem.genre_id == bindparam("genre_id"))
+            .order_by(models.TrendingItem.rank)
+            .limit(bindparam("limit")))
+
 def calculate_album_duration(db: Session, album_id: int) -> int:
     """Calculate total duration of an album by summing its tracks' durations."""
     result = db.query(func.sum(models.MusicItem.duration_seconds)).join(
@@ -17,7 +50,20 @@ def calculate_album_duration(db: Session, album_id: int) -> int:
 ).filter(models.album_tracks.c.album_id == album_id).scalar()
     return result or 0
 
-def serialize_music_item(mi: models.MusicItem, include_tracks: bool = True) -> schemas.MusicItemOut:
+def _validate_album_tracks(db: Session, track_ids) -> None:
+    tracks = db.query(models.MusicItem.id, models.MusicItem.item_type).filter(models.MusicItem.id.in_(track_ids)).all()
+    found_ids = {t.id for t in tracks}
+    missing = set(track_ids) - found_ids
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Tracks not found: {sorted(missing)}")
+    # Ensure all are TRACK type (prevent albums in albums)
+    invalid_types = [t.id for t in tracks if t.item_type != "TRACK"]
+    if invalid_types:
+        raise HTTPException(status_code=400, detail=f"Only TRACK items can be added to albums: {sorted(invalid_types)}")
+
+def serialize_music_item(mi: models.MusicItem, include_tracks: bool = True, fields: set[str] | None = None) -> schemas.MusicItemOut:
+    # fields restricts which relations are touched (sparse fieldsets, see batch_get_music_items);
+    # None means everything
     # Base serialization
     data = dict(
         id=mi.id,
@@ -25,22 +71,25 @@ def serialize_music_item(mi: models.MusicItem, include_tracks: bool = True) -> s
         item_type=mi.item_type,
         release_year=mi.release_year,
         duration_seconds=mi.duration_seconds,
-        artists=[schemas.ArtistOut.model_validate(a.artist) for a in mi.artists],
-        genres=[schemas.GenreOut.model_validate(g.genre) for g in mi.genres],
     )
+    if fields is None or "artists" in fields:
+        data["artists"] = [schemas.ArtistOut.model_validate(a.artist) for a in mi.artists]
+    if fields is None or "genres" in fields:
+        data["genres"] = [schemas.GenreOut.model_validate(g.genre) for g in mi.genres]
     # Add tracks if album
-    if include_tracks and mi.item_type == "ALBUM":
+    if include_tracks and mi.item_type == "ALBUM" and (fields is None or "tracks" in fields):
         # Ensure album_tracks loaded
         tracks = []
         for at in sorted(mi.album_tracks, key=lambda x: x.track_number):
             # Avoid deep recursion by not including tracks' own album memberships
-            tracks.append(serialize_music_item(at.track, include_tracks=False))
+            tracks.append(serialize_music_item(at.track, include_tracks=False, fields=fields))
         data["tracks"] = tracks
     else:
         data["tracks"] = []
     return schemas.MusicItemOut(**data)
 
 @router.post("", response_model=schemas.MusicItemOut, status_code=201, dependencies=[Depends(require_admin)])
+@query_budget(queries=18, ms=200)
 def create_music_item(payload: schemas.MusicItemCreate, db: Session = Depends(get_db)):
     # Validate duration_seconds not provided for albums
     if payload.item_type == "ALBUM" and payload.duration_seconds is not None:
@@ -64,17 +113,9 @@ def create_music_item(payload: schemas.MusicItemCreate, db: Session = Depends(ge
     # Album tracks (only if album)
     if payload.item_type == "ALBUM" and payload.track_ids:
         # Validate tracks exist and are TRACK type
-        tracks = db.query(models.MusicItem).filter(models.MusicItem.id.in_(payload.track_ids)).all()
-        found_ids = {t.id for t in tracks}
-        missing = set(payload.track_ids) - found_ids
-        if missing:
-            raise HTTPException(status_code=400, detail=f"Tracks not found: {sorted(missing)}")
-        # Ensure all are TRACK type (prevent albums in albums)
-        invalid_types = [t.id for t in tracks if t.item_type != "TRACK"]
-        if invalid_types:
-            raise HTTPException(status_code=400, detail=f"Only TRACK items can be added to albums: {sorted(invalid_types)}")
+        _validate_album_tracks(db, payload.track_ids)
         for idx, tid in enumerate(payload.track_ids, start=1):
-            db.add(models.AlbumTrack(album_id=mi.id, track_id=tid, track_number=idx))
+            db.add(models.AlbumTrack(album_id=mi.id, track_id=tid, track_number=idx * TRACK_NUMBER_GAP))
 
     # Calculate duration for albums
     if mi.item_type == "ALBUM":
@@ -84,41 +125,162 @@ def create_music_item(payload: schemas.MusicItemCreate, db: Session = Depends(ge
 
     db.commit()
     db.refresh(mi)
+    hub.publish("music_item.created", music_item_id=mi.id)
     return get_music_item(mi.id, db)
 
-@router.get("", response_model=list[schemas.MusicItemOut])
+@router.get("", response_model=list[schemas.MusicItemOut], dependencies=[Depends(limit("list_music_items", rate=2, burst=10))])
+@query_budget(queries=11, ms=250)
 def list_music_items(
     db: Session = Depends(get_db),
     q: str | None = Query(default=None, description="Search in title"),
     genre_id: int | None = None,
     artist_id: int | None = None,
+    offset: int = Query(default=0, ge=0),
+    limit: int | None = Query(default=None, ge=1, le=1000, description="Page size (default: all)"),
 ):
-    query = db.query(models.MusicItem).options(
-        selectinload(models.MusicItem.artists).selectinload(models.MusicItemArtist.artist),
-        selectinload(models.MusicItem.genres).selectinload(models.MusicItemGenre.genre),
-    )
+    # Served from the in-memory browse index when enabled and in sync (falls back to SQL otherwise)
+    if catalog_index.usable():
+        return catalog_index.search(q, genre_id, artist_id, offset, limit)
+    # Lambda statement: cached per combination of filters, the closure values become bound
+    # parameters. Every branch that changes the SQL shape needs its own lambda (limit None vs n).
+    # Genre/artist filters are EXISTS, not joins: an artist can be linked in several roles and
+    # a join would return (and page over) the item once per role.
+    stmt = lambda_stmt(lambda: ITEMS)
     if q:
-        query = query.filter(models.MusicItem.title.ilike(f"%{q}%"))
+        pattern = f"%{q}%"
+        stmt += lambda s: s.where(models.MusicItem.title.ilike(pattern))
     if genre_id:
-        query = query.join(models.MusicItem.genres).filter(models.MusicItemGenre.genre_id == genre_id)
+        stmt += lambda s: s.where(models.MusicItem.genres.any(models.MusicItemGenre.genre_id == genre_id))
     if artist_id:
-        query = query.join(models.MusicItem.artists).filter(models.MusicItemArtist.artist_id == artist_id)
-    items = query.all()
+        stmt += lambda s: s.where(models.MusicItem.artists.any(models.MusicItemArtist.artist_id == artist_id))
+    if limit is not None:
+        stmt += lambda s: s.order_by(models.MusicItem.id).offset(offset).limit(limit)
+    elif offset:
+        stmt += lambda s: s.order_by(models.MusicItem.id).offset(offset)
+    items = db.execute(stmt).scalars().all()
     return [serialize_music_item(mi) for mi in items]
 
+@router.get("/trending", response_model=list[schemas.TrendingItemOut])
+@query_budget(queries=12, ms=100)
+def list_trending_items(
+    db: Session = Depends(get_db),
+    window: str = Query(default="week", pattern="^(day|week)$"),
+    genre_id: int | None = None,
+    limit: int = Query(default=20, ge=1, le=trending.TOP_N),
+):
+    # precomputed by app.core.trending.refresh; declared before /{item_id}
+    rows = db.execute(TRENDING, {"window": window, "genre_id": genre_id or 0, "limit": limit}).scalars().all()
+    return [schemas.TrendingItemOut(rank=r.rank, score=r.score, music_item=serialize_music_item(r.music_item)) for r in rows]
+
+BATCH_FIELDS = {"id", "title", "item_type", "release_year", "duration_seconds", "artists", "genres", "tracks"}
+BATCH_MAX_IDS = 200
+
+@router.get(":batch")
+@query_budget(queries=7, ms=150)
+def batch_get_music_items(
+    db: Session = Depends(get_db),
+    ids: str = Query(description="Comma separated music item ids"),
+    fields: str | None = Query(default=None, description=f"Comma separated subset of {sorted(BATCH_FIELDS)}; default all"),
+):
+    """Load many items in one set of queries. Only the relations named in fields are loaded
+    and only the requested fields are returned (id is always included). Unknown ids are skipped;
+    the result keeps the order of ids."""
+    try:
+        id_list = list(dict.fromkeys(int(i) for i in ids.split(",") if i.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma separated list of integers")
+    if not id_list or len(id_list) > BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Provide between 1 and {BATCH_MAX_IDS} ids")
+    wanted = BATCH_FIELDS if fields is None else {f.strip() for f in fields.split(",") if f.strip()} | {"id"}
+    unknown = wanted - BATCH_FIELDS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {sorted(unknown)}")
+
+    options = []
+    if "artists" in wanted:
+        options.append(selectinload(models.MusicItem.artists).selectinload(models.MusicItemArtist.artist))
+    if "genres" in wanted:
+        options.append(selectinload(models.MusicItem.genres).selectinload(models.MusicItemGenre.genre))
+    if "tracks" in wanted:
+        options.append(selectinload(models.MusicItem.album_tracks).selectinload(models.AlbumTrack.track))
+        if "artists" in wanted:
+            options.append(selectinload(models.MusicItem.album_tracks).selectinload(models.AlbumTrack.track).selectinload(models.MusicItem.artists).selectinload(models.MusicItemArtist.artist))
+        if "genres" in wanted:
+            options.append(selectinload(models.MusicItem.album_tracks).selectinload(models.AlbumTrack.track).selectinload(models.MusicItem.genres).selectinload(models.MusicItemGenre.genre))
+
+    # Album tracks are shaped with the same fieldset (minus their own tracks)
+    include: dict = {f: True for f in wanted}
+    if "tracks" in wanted:
+        include["tracks"] = {"__all__": wanted - {"tracks"}}
+
+    items = {mi.id: mi for mi in db.query(models.MusicItem).options(*options).filter(models.MusicItem.id.in_(id_list)).all()}
+    return [
+        serialize_music_item(items[i], fields=wanted).model_dump(include=include)
+        for i in id_list if i in items
+    ]
+
 @router.get("/{item_id}", response_model=schemas.MusicItemOut)
+@query_budget(queries=11, ms=100)
 def get_music_item(item_id: int, db: Session = Depends(get_db)):
-    mi = db.query(models.MusicItem).options(
-        selectinload(models.MusicItem.artists).selectinload(models.MusicItemArtist.artist),
-        selectinload(models.MusicItem.genres).selectinload(models.MusicItemGenre.genre),
-        selectinload(models.MusicItem.album_tracks).selectinload(models.AlbumTrack.track).selectinload(models.MusicItem.artists).selectinload(models.MusicItemArtist.artist),
-        selectinload(models.MusicItem.album_tracks).selectinload(models.AlbumTrack.track).selectinload(models.MusicItem.genres).selectinload(models.MusicItemGenre.genre),
-    ).get(item_id)
+    mi = db.execute(ITEM_BY_ID, {"item_id": item_id}).scalar_one_or_none()
+    # (not Query.get: when create/update already hold the item in the session it would skip
+    # the query and its loader options, and every track relation would lazy load one by one)
     if not mi:
         raise HTTPException(status_code=404, detail="Music item not found")
     return serialize_music_item(mi)
 
+def _get_album(db: Session, album_id: int):
+    album = db.query(models.MusicItem.id, models.MusicItem.title, models.MusicItem.item_type).filter(models.MusicItem.id == album_id).one_or_none()
+    if not album:
+        raise HTTPException(status_code=404, detail="Music item not found")
+    if album.item_type != "ALBUM":
+        raise HTTPException(status_code=400, detail="Only ALBUM items can be streamed as a whole")
+    return album
+
+@router.get("/{album_id}/stream")
+@query_budget(queries=4, ms=100)
+def stream_album(album_id: int, request: Request, db: Session = Depends(get_db), user: models.User = Depends(get_current_user)):
+    # Track files back to back (MPEG audio frames only, no re-encoding) with Range support
+    # across track boundaries; the body is read chunk by chunk, each with a short session
+    _get_album(db, album_id)
+    segments = album_segments(db, album_id)
+    # get_db would only close the session after the whole body (the entire playback) has been
+    # sent - release its connection now, iter_range reads each chunk with its own session
+    db.close()
+    if not segments:
+        raise HTTPException(status_code=404, detail="No audio files for this album")
+    total = sum(s.length for s in segments)
+    headers = {"Accept-Ranges": "bytes"}
+    try:
+        byte_range = parse_range(request.headers.get("range"), total)
+    except ValueError:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{total}"})
+    start, end = byte_range or (0, total - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{total}"
+    return StreamingResponse(iter_range(segments, start, end), status_code=206 if byte_range else 200,
+                             media_type="audio/mpeg", headers=headers)
+
+@router.get("/{album_id}/stream.m3u8")
+@query_budget(queries=3, ms=100)
+def album_playlist(album_id: int, request: Request, db: Session = Depends(get_db), user: models.User = Depends(get_current_user)):
+    # Extended M3U (UTF-8) pointing at the per-track downloads, for players that prefer separate tracks
+    album = _get_album(db, album_id)
+    tracks = db.query(models.MusicItem.id, models.MusicItem.title, models.MusicItem.duration_seconds).join(
+        models.AlbumTrack, models.AlbumTrack.track_id == models.MusicItem.id
+    ).join(
+        models.TrackFile, models.TrackFile.track_id == models.MusicItem.id
+    ).filter(models.AlbumTrack.album_id == album_id, func.length(models.TrackFile.file_data) > 0).order_by(models.AlbumTrack.track_number).all()
+    lines = ["#EXTM3U", f"#PLAYLIST:{album.title}"]
+    for t in tracks:
+        lines.append(f"#EXTINF:{t.duration_seconds or -1},{t.title}")
+        lines.append(str(request.url_for("download_track_file", track_id=t.id)))
+    return Response("\n".join(lines) + "\n", media_type="application/vnd.apple.mpegurl",
+                    headers={"Content-Disposition": f"inline; filename=\"album-{album_id}.m3u8\""})
+
 @router.put("/{item_id}", response_model=schemas.MusicItemOut, dependencies=[Depends(require_admin)])
+@query_budget(queries=17, ms=200)
 def update_music_item(item_id: int, payload: schemas.MusicItemUpdate, db: Session = Depends(get_db)):
     mi = db.get(models.MusicItem, item_id)
     if not mi:
@@ -147,27 +309,98 @@ def update_music_item(item_id: int, payload: schemas.MusicItemUpdate, db: Sessio
             raise HTTPException(status_code=400, detail="Can only set track_ids for album items")
         db.query(models.AlbumTrack).filter(models.AlbumTrack.album_id == item_id).delete()
         if payload.track_ids:
-            tracks = db.query(models.MusicItem).filter(models.MusicItem.id.in_(payload.track_ids)).all()
-            found_ids = {t.id for t in tracks}
-            missing = set(payload.track_ids) - found_ids
-            if missing:
-                raise HTTPException(status_code=400, detail=f"Tracks not found: {sorted(missing)}")
-            # Ensure all are TRACK type (prevent albums in albums)
-            invalid_types = [t.id for t in tracks if t.item_type != "TRACK"]
-            if invalid_types:
-                raise HTTPException(status_code=400, detail=f"Only TRACK items can be added to albums: {sorted(invalid_types)}")
+            _validate_album_tracks(db, payload.track_ids)
             for idx, tid in enumerate(payload.track_ids, start=1):
-                db.add(models.AlbumTrack(album_id=item_id, track_id=tid, track_number=idx))
+                db.add(models.AlbumTrack(album_id=item_id, track_id=tid, track_number=idx * TRACK_NUMBER_GAP))
 
+    mi.updated_at = func.now()  # also when only the artist/genre/track lists changed
     db.commit()
     db.refresh(mi)
+    hub.publish("music_item.updated", music_item_id=item_id)
     return get_music_item(item_id, db)
 
-@router.delete("/{item_id}", status_code=204, dependencies=[Depends(require_admin)])
-def delete_music_item(item_id: int, db: Session = Depends(get_db)):
+def _place(rows: list, row: models.AlbumTrack, position: int | None) -> None:
+    """Insert row into the ordered list at 1-based position (None = append) and give it a
+    track_number between its neighbours. Renumbers the whole list if there is no gap."""
+    idx = len(rows) if position is None else max(0, min(position - 1, len(rows)))
+    rows.insert(idx, row)
+    prev_key = rows[idx - 1].track_number if idx > 0 else 0
+    next_key = rows[idx + 1].track_number if idx + 1 < len(rows) else prev_key + 2 * TRACK_NUMBER_GAP
+    if next_key - prev_key >= 2:
+        row.track_number = (prev_key + next_key) // 2
+    else:
+        # Rebalance; the ORM only writes rows whose number actually changed
+        for i, r in enumerate(rows, start=1):
+            r.track_number = i * TRACK_NUMBER_GAP
+
+@router.patch("/{item_id}/tracks", response_model=schemas.MusicItemOut, dependencies=[Depends(require_admin)])
+@query_budget(queries=16, ms=200)
+def patch_album_tracks(item_id: int, payload: schemas.AlbumTracksPatch, db: Session = Depends(get_db)):
+    """Apply insert / move / remove operations to an album track list in order.
+    Only touched AlbumTrack rows are written and only newly added track ids are validated."""
     mi = db.get(models.MusicItem, item_id)
     if not mi:
-        return
-    db.delete(mi)
+        raise HTTPException(status_code=404, detail="Music item not found")
+    if mi.item_type != "ALBUM":
+        raise HTTPException(status_code=400, detail="Can only edit tracks of album items")
+
+    # Association rows only - the tracks themselves are not loaded
+    rows = db.query(models.AlbumTrack).filter(models.AlbumTrack.album_id == item_id).order_by(models.AlbumTrack.track_number).all()
+    by_track = {r.track_id: r for r in rows}
+    added = set()
+
+    for op in payload.operations:
+        row = by_track.get(op.track_id)
+        if op.op == "insert":
+            if row is not None:
+                raise HTTPException(status_code=400, detail=f"Track {op.track_id} is already on this album")
+            row = models.AlbumTrack(album_id=item_id, track_id=op.track_id)
+            by_track[op.track_id] = row
+            added.add(op.track_id)
+            _place(rows, row, op.position)
+            continue
+        if row is None:
+            raise HTTPException(status_code=400, detail=f"Track {op.track_id} is not on this album")
+        rows.remove(row)
+        if op.op == "move":
+            _place(rows, row, op.position)
+        else:  # remove
+            del by_track[op.track_id]
+            if op.track_id in added:
+                added.discard(op.track_id)
+            else:
+                db.delete(row)
+
+    if added:
+        _validate_album_tracks(db, added)
+        db.add_all(by_track[tid] for tid in added)
+
+    mi.updated_at = func.now()
+    db.commit()
+    hub.publish("music_item.updated", music_item_id=item_id)
+    return get_music_item(item_id, db)
+
+@router.post("/bulk-delete", dependencies=[Depends(require_admin)])
+@query_budget(queries=2, ms=100)
+def bulk_delete_music_items(payload: schemas.MusicItemBulkDelete, db: Session = Depends(get_db)):
+    # One DELETE for all items; reviews, collection entries, album links and files go via ON DELETE CASCADE
+    deleted = db.execute(
+        delete(models.MusicItem).where(models.MusicItem.id.in_(payload.ids)).returning(models.MusicItem.id)
+    ).scalars().all()
+    db.commit()
+    # One event per batch instead of per id (each publish is a pg_notify round trip);
+    # batches keep the payload below the 8000 byte NOTIFY limit
+    deleted = sorted(deleted)
+    for i in range(0, len(deleted), DELETED_EVENT_BATCH):
+        hub.publish("music_item.deleted", music_item_ids=deleted[i:i + DELETED_EVENT_BATCH])
+    return {"deleted": deleted}
+
+@router.delete("/{item_id}", status_code=204, dependencies=[Depends(require_admin)])
+@query_budget(queries=2, ms=100)
+def delete_music_item(item_id: int, db: Session = Depends(get_db)):
+    # Set-based delete instead of db.delete(mi): the ORM cascade would load every child row (and the blob) first
+    result = db.execute(delete(models.MusicItem).where(models.MusicItem.id == item_id))
     db.commit()
+    if result.rowcount:
+        hub.publish("music_item.deleted", music_item_id=item_id)
     return
\ No newline at end of file
@@ -4,10 +4,13 @@ from sqlalchemy.orm import Session, joinedload
 from app.database import get_db
 from app import models, schemas
 from app.core.auth import get_current_user
+from app.core.budgets import query_budget
+from app.core import trending
 
 router = APIRouter()
 
 @router.post("", response_model=schemas.ReviewOut, status_code=201)
+@query_budget(queries=7, ms=100)
 def create_or_update_review(payload: schemas.ReviewCreate, db: Session = Depends(get_db), user: models.User = Depends(get_current_user)):
     # Ensure item exists
     mi = db.get(models.MusicItem, payload.music_item_id)
@@ -30,11 +33,13 @@ def create_or_update_review(payload: schemas.ReviewCreate, db: Session = Depends
     review = models.Review(user_id=user.id, music_item_id=payload.music_item_id,
                            rating=payload.rating, text=payload.text)
     db.add(review)
+    trending.record(db, payload.music_item_id, trending.REVIEWED)  # edits of an existing review don't count
     db.commit()
     db.refresh(review)
     return review
 
 @router.get("/item/{music_item_id}", response_model=list[schemas.ReviewOut])
+@query_budget(queries=1, ms=150)
 def list_reviews_for_item(music_item_id: int, db: Session = Depends(get_db)):
     return db.query(models.Review).filter(
         models.Review.music_item_id == music_item_id
@@ -43,6 +48,7 @@ def list_reviews_for_item(music_item_id: int, db: Session = Depends(get_db)):
     ).all()
 
 @router.delete("/{review_id}", status_code=204)
+@query_budget(queries=3, ms=100)
 def delete_review(review_id: int, db: Session = Depends(get_db), user: models.User = Depends(get_current_user)):
     review = db.get(models.Review, review_id)
     if not review:
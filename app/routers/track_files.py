@@ -1,16 +1,47 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Response, BackgroundTasks
-from sqlalchemy.orm import Session
-import io
-from pydub import AudioSegment
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Response, BackgroundTasks, Query
+from sqlalchemy import func
+from sqlalchemy.orm import Session, undefer
+from typing import Optional
+import asyncio
+import os
+import tempfile
 from app.database import get_db, SessionLocal
 from app import models, schemas
 from app.core.auth import require_admin, get_current_user
+from app.core.events import hub
+from app.core.admission import limit, upload_slot, transcode_slots, UploadSlot
+from app.core import transcoder, fingerprint
+from app.core.config import settings
 import time
+from app.core.budgets import query_budget
 
 router = APIRouter()
 
-@router.post("/tracks/{track_id}/file", response_model=schemas.TrackFileOut, dependencies=[Depends(require_admin)])
-async def upload_track_file(track_id: int, background: BackgroundTasks, upload: UploadFile = File(...), db: Session = Depends(get_db)):
+TRANSCODE_QUEUE_TIMEOUT = 300  # seconds a background transcode waits for a free slot
+
+def fingerprint_upload(db: Session, track_id: int, path: str) -> Optional[int]:
+    """Fingerprint and index the upload (in db's transaction). Returns a duplicate track whose
+    stored file can be reused instead of transcoding, when APP_FINGERPRINT_REUSE_BLOBS is on."""
+    try:
+        signature = fingerprint.fingerprint(path)
+    except (fingerprint.FingerprintError, transcoder.TranscodeError) as e:
+        print(f"[BG] Fingerprint skipped for track {track_id}: {e}")
+        return None
+    fingerprint.index_track(db, track_id, signature)
+    if not settings.fingerprint_reuse_blobs:
+        return None
+    for dup_id, _, _ in fingerprint.find_duplicates(db, track_id, settings.fingerprint_reuse_min_similarity, limit=5):
+        ready = db.query(models.TrackFile.id).filter(models.TrackFile.track_id == dup_id,
+                                                     func.length(models.TrackFile.file_data) > 0).first()
+        if ready:
+            return dup_id
+    return None
+
+@router.post("/tracks/{track_id}/file", response_model=schemas.TrackFileOut,
+             dependencies=[Depends(limit("upload", rate=0.2, burst=5, per_user=True)), Depends(require_admin)])
+@query_budget(queries=6, ms=250)
+async def upload_track_file(track_id: int, background: BackgroundTasks, upload: UploadFile = File(...),
+                            db: Session = Depends(get_db), slot: UploadSlot = Depends(upload_slot)):
     start_time = time.perf_counter()
     log = []
 
@@ -32,41 +63,72 @@ async def upload_track_file(track_id: int, background: BackgroundTasks, upload:
         print("\n".join(log))
         raise HTTPException(status_code=400, detail="Files can only be attached to TRACK items")
 
-    data = await upload.read()
-    log_time("Read upload data")
-    original_size = len(data)
-
-    # Protect server from very large uploads (avoid OOM / DB crash)
+    # Spool the upload to disk in chunks instead of reading it into memory
     MAX_UPLOAD_BYTES = 20_000_000  # ~20 MB
-    if original_size > MAX_UPLOAD_BYTES:
-        log_time("File too large")
-        print("\n".join(log))
-        raise HTTPException(status_code=413, detail=f"Uploaded file too large ({original_size} bytes). Max is {MAX_UPLOAD_BYTES} bytes.")
+    fd, upload_path = tempfile.mkstemp(suffix=".upload")
+    # Until the background task owns it, remove the spooled file on any error (up to 20 MB in /tmp)
+    try:
+        original_size = 0
+        with os.fdopen(fd, "wb") as spool:
+            while chunk := await upload.read(transcoder.CHUNK_SIZE):
+                original_size += len(chunk)
+                # Protect server from very large uploads (avoid OOM / DB crash)
+                if original_size > MAX_UPLOAD_BYTES:
+                    break
+                spool.write(chunk)
+        log_time("Spooled upload data")
+        if original_size > MAX_UPLOAD_BYTES:
+            log_time("File too large")
+            print("\n".join(log))
+            raise HTTPException(status_code=413, detail=f"Uploaded file too large. Max is {MAX_UPLOAD_BYTES} bytes.")
+        # The slot caps concurrent request bodies; the transcode is capped by transcode_slots
+        slot.release()
 
-    # Instead of transcode synchronously, create a placeholder DB record and do heavy work in background
-    existing = db.query(models.TrackFile).filter(models.TrackFile.track_id == track_id).one_or_none()
-    log_time("Checked for existing TrackFile")
-    if existing:
-        # overwrite metadata but clear data until background task finishes
-        existing.filename = upload.filename
-        existing.content_type = upload.content_type
-        existing.file_data = b""
-        existing.compressed = False
-        existing.original_size = original_size
-        db.commit()
-        db.refresh(existing)
-        tf = existing
-        log_time("Updated existing TrackFile")
-    else:
-        tf = models.TrackFile(track_id=track_id, filename=upload.filename, content_type=upload.content_type,
-                               file_data=b"", compressed=False, original_size=original_size)
-        db.add(tf)
-        db.commit()
-        db.refresh(tf)
-        log_time("Created new TrackFile")
+        # Instead of transcode synchronously, create a placeholder DB record and do heavy work in background
+        # (file_data is deferred, so this existence check does not pull the old blob)
+        existing = db.query(models.TrackFile).filter(models.TrackFile.track_id == track_id).one_or_none()
+        log_time("Checked for existing TrackFile")
+        if existing:
+            # overwrite metadata but clear data until background task finishes
+            existing.filename = upload.filename
+            existing.content_type = upload.content_type
+            existing.file_data = b""
+            existing.compressed = False
+            existing.original_size = original_size
+            db.commit()
+            db.refresh(existing)
+            tf = existing
+            log_time("Updated existing TrackFile")
+        else:
+            tf = models.TrackFile(track_id=track_id, filename=upload.filename, content_type=upload.content_type,
+                                   file_data=b"", compressed=False, original_size=original_size)
+            db.add(tf)
+            db.commit()
+            db.refresh(tf)
+            log_time("Created new TrackFile")
+    except BaseException:
+        os.remove(upload_path)
+        raise
 
     # Background worker will transcode and store the real bytes
-    def transcode_and_store(trackfile_id: int, raw_bytes: bytes, filename: str, content_type: str):
+    async def transcode_and_store(trackfile_id: int, path: str):
+        try:
+            # Cap CPU heavy transcodes per worker; queued jobs wait on the event loop (the request's
+            # DB session and upload slot are already released, _transcode opens its own session)
+            try:
+                await asyncio.wait_for(transcode_slots.acquire(), timeout=TRANSCODE_QUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                print(f"[BG] No transcode slot available for TrackFile {trackfile_id}")
+                hub.publish("track_file.failed", track_id=track_id, track_file_id=trackfile_id)
+                return
+            try:
+                await asyncio.to_thread(_transcode, trackfile_id, path)
+            finally:
+                transcode_slots.release()
+        finally:
+            os.remove(path)
+
+    def _transcode(trackfile_id: int, path: str):
         session = SessionLocal()
         bg_start = time.perf_counter()
         def bg_log(msg):
@@ -78,45 +140,61 @@ async def upload_track_file(track_id: int, background: BackgroundTasks, upload:
             bg_log("Fetched TrackFile from DB")
             if not tf_obj:
                 bg_log("TrackFile not found")
-                session.close()
                 return
+            reuse_from = fingerprint_upload(session, track_id, path) if settings.fingerprint_enabled else None
+            bg_log("Fingerprinted upload")
             try:
-                in_buf = io.BytesIO(raw_bytes)
-                audio = AudioSegment.from_file(in_buf, format="mp3")
-                bg_log("Loaded audio with pydub")
-                out_buf = io.BytesIO()
-                audio.export(out_buf, format="mp3", bitrate="64k")
-                out_bytes = out_buf.getvalue()
-                bg_log("Exported audio to mp3 64k")
-            except Exception:
+                if reuse_from is not None:
+                    size = transcoder.copy_blob(session, trackfile_id, reuse_from)
+                    bg_log(f"Reused stored file of duplicate track {reuse_from} ({size} bytes)")
+                else:
+                    size, transcoded = transcoder.transcode_to_blob(session, trackfile_id, path)
+                    bg_log(f"Stored {'transcoded' if transcoded else 'original'} file ({size} bytes)")
+            except transcoder.TranscodeError as e:
                 # On transcode failure, leave placeholder and record original_size; do not raise
-                bg_log("Transcode failed")
-                session.close()
+                session.rollback()
+                bg_log(f"Transcode failed: {e}")
+                hub.publish("track_file.failed", track_id=track_id, track_file_id=trackfile_id)
                 return
-            tf_obj.file_data = out_bytes
+            tf_obj.content_type = "audio/mpeg"  # target format, or probed as MP3 already
             tf_obj.compressed = False
-            tf_obj.original_size = len(raw_bytes)
-            session.add(tf_obj)
+            tf_obj.original_size = original_size
             session.commit()
             bg_log("Saved transcoded file to DB")
+            hub.publish("track_file.ready", track_id=track_id, track_file_id=trackfile_id, size=size)
         finally:
             session.close()
             bg_log("Closed DB session")
 
     # Schedule background transcoding
-    background.add_task(transcode_and_store, tf.id, data, upload.filename, upload.content_type)
+    background.add_task(transcode_and_store, tf.id, upload_path)
     log_time("Scheduled background task")
     print("\n".join(log))
-    # Return placeholder record (consumer can poll or re-GET to retrieve once processed)
-    return tf
+    # Return placeholder record (consumer can subscribe to /events/stream for track_file.ready instead of polling).
+    # Background tasks run before the dependencies are torn down - close the session now, not after the transcode.
+    out = schemas.TrackFileOut.model_validate(tf)
+    db.close()
+    return out
 
 @router.get("/tracks/{track_id}/file")
+@query_budget(queries=2, ms=100)
 def download_track_file(track_id: int, db: Session = Depends(get_db), user: models.User = Depends(get_current_user)):
-    tf = db.query(models.TrackFile).filter(models.TrackFile.track_id == track_id).one_or_none()
+    # file_data is deferred on the model - load it in the same query here
+    tf = db.query(models.TrackFile).options(undefer(models.TrackFile.file_data)).filter(models.TrackFile.track_id == track_id).one_or_none()
     if not tf:
         raise HTTPException(status_code=404, detail="File not found")
     data = tf.file_data
     # No decompression step needed — files are stored as ready-to-serve MP3
     headers = {"Content-Disposition": f"attachment; filename=\"{tf.filename}\""}
     return Response(content=data, media_type=tf.content_type or "audio/mpeg", headers=headers)
- 
\ No newline at end of file
+ 
+
+@router.get("/tracks/{track_id}/duplicates", response_model=list[schemas.TrackDuplicateOut], dependencies=[Depends(require_admin)])
+@query_budget(queries=3, ms=100)
+def get_track_duplicates(track_id: int, min_similarity: float = Query(default=0.4, ge=0, le=1),
+                         limit: int = Query(default=20, ge=1, le=100), db: Session = Depends(get_db)):
+    # Near-duplicate recordings (other tracks whose uploaded audio is similar), via the LSH index
+    matches = fingerprint.find_duplicates(db, track_id, min_similarity, limit)
+    if matches is None:
+        raise HTTPException(status_code=404, detail="No fingerprint for this track (no file uploaded yet)")
+    return [schemas.TrackDuplicateOut(track_id=tid, title=title, similarity=round(sim, 3)) for tid, title, sim in matches]
@@ -44,6 +44,17 @@ class MusicItemUpdate(BaseModel):
     genre_ids: Optional[list[int]] = None
     track_ids: Optional[list[int]] = None  # replace full album track list if provided - Only valid when item_type == 'ALBUM'
 
+class AlbumTrackOperation(BaseModel):
+    op: str = Field(pattern="^(insert|move|remove)$")
+    track_id: int
+    position: Optional[int] = Field(default=None, ge=1)  # 1-based target position for insert/move, None = end
+
+class AlbumTracksPatch(BaseModel):
+    operations: list[AlbumTrackOperation] = Field(min_length=1)
+
+class MusicItemBulkDelete(BaseModel):
+    ids: list[int] = Field(min_length=1, max_length=1000)
+
 class MusicItemOut(BaseModel):
     id: int
     title: str
@@ -88,6 +99,18 @@ class CollectionEntryOut(BaseModel):
     class Config:
         model_config = {"from_attributes": True}
 
+class UserStatsOut(BaseModel):
+    user_id: int
+    item_count: int = 0
+    total_duration_seconds: int = 0
+    like_count: int = 0
+    dislike_count: int = 0
+    like_ratio: Optional[float] = None  # likes / (likes + dislikes)
+    favourite_count: int = 0
+    genre_counts: dict[int, int] = {}  # genre id -> collected items
+    artist_counts: dict[int, int] = {}  # artist id -> collected items
+    favourite_decades: dict[int, int] = {}  # decade (1990, 2000, ...) -> favourites
+
 # Track file (binary stored compressed in DB)
 class TrackFileOut(BaseModel):
     id: int
@@ -99,5 +122,15 @@ class TrackFileOut(BaseModel):
     class Config:
         from_attributes = True
 
+class TrackDuplicateOut(BaseModel):
+    track_id: int
+    title: str
+    similarity: float  # estimated share of matching spectral peak pairs, 0..1
+
+class TrendingItemOut(BaseModel):
+    rank: int
+    score: float  # decayed, weighted collection/review events (see app/core/trending.py)
+    music_item: MusicItemOut
+
 # Forward reference resolution for recursive model
 MusicItemOut.model_rebuild()
\ No newline at end of file
@@ -0,0 +1,134 @@
+"""Partition pruning benchmark for user_collections / reviews (Postgres only).
+
+    python benchmarks/partitioning.py --db postgresql+psycopg://localhost/music_bench [--partitions 16]
+                                      [--users 20000] [--items 50000] [--per-user 100] [--reviews-per-item 10]
+
+Seeds a scratch database (tables are dropped and recreated - never point this at a real
+one), then runs the hot queries of get_collection and list_reviews_for_item with
+EXPLAIN (ANALYZE, BUFFERS) for random ids, first on plain tables, then after converting
+them online with app.core.partitioning. Prints per layout how many relations the plan
+touches, execution time and buffers (medians), plus the conversion time.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", required=True)
+    parser.add_argument("--partitions", type=int, default=16)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--items", type=int, default=50_000)
+    parser.add_argument("--per-user", type=int, default=100)
+    parser.add_argument("--reviews-per-item", type=int, default=10)
+    parser.add_argument("--samples", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    return parser.parse_args()
+
+
+args = parse_args()
+# Settings are read at import time - configure before importing the app
+os.environ["APP_DATABASE_URL"] = args.db
+os.environ.setdefault("APP_ECHO_SQL", "false")
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.orm import joinedload  # noqa: E402
+
+from app import models  # noqa: E402
+from app.core.partitioning import TABLES, convert  # noqa: E402
+from app.database import Base, engine, SessionLocal  # noqa: E402
+
+
+def seed():
+    with engine.begin() as conn:
+        for table in TABLES:  # leftovers of an interrupted conversion
+            conn.execute(text(f"DROP TABLE IF EXISTS {table}__new CASCADE"))
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    p = {"users": args.users, "items": args.items, "per_user": args.per_user, "per_item": args.reviews_per_item}
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, email, display_name, role) "
+                          "SELECT u, 'user' || u || '@example.com', 'User ' || u, 'USER' FROM generate_series(1, :users) u"), p)
+        conn.execute(text("INSERT INTO music_items (id, title, item_type) "
+                          "SELECT i, 'Item ' || i, 'TRACK' FROM generate_series(1, :items) i"), p)
+        # distinct items per user / distinct users per item, spread over the whole id range
+        conn.execute(text("INSERT INTO user_collections (user_id, music_item_id, preference, is_favourite) "
+                          "SELECT u, 1 + (u * 7919 + k) % :items, 'LIKE', k % 5 = 0 "
+                          "FROM generate_series(1, :users) u, generate_series(0, :per_user - 1) k"), p)
+        conn.execute(text("INSERT INTO reviews (user_id, music_item_id, rating, text) "
+                          "SELECT 1 + (i * 31 + k) % :users, i, 1 + k % 5, 'ok' "
+                          "FROM generate_series(1, :items) i, generate_series(0, :per_item - 1) k"), p)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("VACUUM ANALYZE"))
+
+
+def hot_queries(db) -> dict:
+    # the statements the routes issue (see get_collection / list_reviews_for_item)
+    return {
+        "get_collection": lambda: db.query(models.UserCollection).filter(
+            models.UserCollection.user_id == random.randint(1, args.users)),
+        "list_reviews_for_item": lambda: db.query(models.Review).filter(
+            models.Review.music_item_id == random.randint(1, args.items)).options(joinedload(models.Review.user)),
+    }
+
+
+def relations(plan: dict) -> set:
+    found = {plan["Relation Name"]} if "Relation Name" in plan else set()
+    for child in plan.get("Plans", []):
+        found |= relations(child)
+    return found
+
+
+def measure(layout: str):
+    db = SessionLocal()
+    try:
+        for name, make in hot_queries(db).items():
+            touched, ms, buffers = [], [], []
+            for _ in range(args.samples):
+                sql = str(make().statement.compile(engine, compile_kwargs={"literal_binds": True}))
+                out = db.execute(text("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql)).scalar()
+                result = (json.loads(out) if isinstance(out, str) else out)[0]
+                plan = result["Plan"]
+                touched.append(len(relations(plan) - {"users"}))
+                ms.append(result["Execution Time"])
+                buffers.append(plan.get("Shared Hit Blocks", 0) + plan.get("Shared Read Blocks", 0))
+            print(f"{layout:<16}{name:<24}{statistics.median(touched):>10.0f}{statistics.median(ms):>12.3f}{statistics.median(buffers):>10.0f}")
+    finally:
+        db.close()
+
+
+def main():
+    if engine.dialect.name != "postgresql":
+        sys.exit("partitioning benchmark needs Postgres (--db postgresql+psycopg://...)")
+    start = time.perf_counter()
+    seed()
+    with engine.connect() as conn:
+        counts = {t: conn.execute(text(f"SELECT count(*) FROM {t}")).scalar() for t in TABLES}
+    print(f"seeded {counts} in {time.perf_counter() - start:.1f}s\n")
+
+    print(f"{'layout':<16}{'query':<24}{'relations':>10}{'exec ms':>12}{'buffers':>10}")
+    measure("plain")
+
+    start = time.perf_counter()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for table in TABLES:
+            convert(conn, table, args.partitions, args.batch_size)
+        after = {t: conn.execute(text(f"SELECT count(*) FROM {t}")).scalar() for t in TABLES}
+    converted = time.perf_counter() - start
+    measure(f"hash({args.partitions})")
+
+    print(f"\nonline conversion: {converted:.1f}s for {sum(counts.values())} rows")
+    if after != counts:
+        sys.exit(f"row counts differ after conversion: {counts} -> {after}")
+
+
+if __name__ == "__main__":
+    main()
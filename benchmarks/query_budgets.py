@@ -0,0 +1,237 @@
+"""Query-count and latency budget check for every route.
+
+    python benchmarks/query_budgets.py [--sizes 10,1000,10000] [--db sqlite:////tmp/budgets.db]
+
+Seeds a database with N music items (plus artists, genres, albums, users, collections,
+reviews, a track file) for each size, calls every route once and records the number of
+SQL statements and the wall time. Budgets are declared on the routes with
+@query_budget (app/core/budgets.py). Exits with status 1 when a route
+  * has no budget or no scenario below,
+  * issues more statements than its budget,
+  * issues a different number of statements at different sizes (constant=True),
+  * is slower than its ms budget at the largest size,
+or when a filtered GET /music-items repeats items or its pages don't add up to the full list.
+Uses a local SQLite file by default; pass --db postgresql+psycopg://... for a local Postgres
+(the database is dropped and recreated - never point this at a real one).
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN = {"X-User-Id": "1", "X-Role": "ADMIN"}
+USER = {"X-User-Id": "2", "X-Role": "USER"}
+ALBUM_SIZE = 10
+COLLECTION_SIZE = 50  # entries per user; kept fixed so get_collection compares like with like
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10,1000,10000")
+    parser.add_argument("--db", default="sqlite:////tmp/query_budgets.db")
+    return parser.parse_args()
+
+
+args = parse_args()
+# Settings are read at import time - configure before importing the app
+os.environ["APP_DATABASE_URL"] = args.db
+os.environ.setdefault("APP_ECHO_SQL", "false")
+os.environ["APP_RATE_LIMITS_ENABLED"] = "false"
+os.environ["APP_CATALOG_INDEX_ENABLED"] = "false"
+sys.path.insert(0, ROOT)
+
+from fastapi.routing import APIRoute  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event, insert, select, text  # noqa: E402
+
+from app import models  # noqa: E402
+from app.core import fingerprint, trending  # noqa: E402
+from app.database import Base, engine, SessionLocal  # noqa: E402
+from main import create_app  # noqa: E402
+
+
+def seed(n: int) -> dict:
+    """N music items in blocks of 11: an album followed by its 10 tracks (item 1 is an album)."""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    n_artists, n_genres, n_users = max(1, n // 10), 20, 50
+    items, artist_links, genre_links, album_tracks = [], [], [], []
+    for i in range(1, n + 1):
+        offset = (i - 1) % (ALBUM_SIZE + 1)
+        items.append({"id": i, "title": f"Item {i}", "item_type": "TRACK" if offset else "ALBUM",
+                      "release_year": 1960 + i % 60, "duration_seconds": 180 + i % 120 if offset else 0})
+        artist_links.append({"music_item_id": i, "artist_id": 1 + i % n_artists, "role": "PRIMARY"})
+        if i % 3 == 0:  # same artist in a second role (role is part of the key)
+            artist_links.append({"music_item_id": i, "artist_id": 1 + i % n_artists, "role": "FEATURED"})
+        genre_links.append({"music_item_id": i, "genre_id": 1 + i % n_genres})
+        if offset:
+            album_tracks.append({"album_id": i - offset, "track_id": i, "track_number": offset * 1024})
+    users = [{"id": u, "email": f"user{u}@example.com", "display_name": f"User {u}", "role": "ADMIN" if u == 1 else "USER"}
+             for u in range(1, n_users + 1)]
+    per_user = min(n // 2, COLLECTION_SIZE)
+    # user u collects items u-1 .. u-2+per_user (user 2 starts with album 1)
+    collections = [{"user_id": u, "music_item_id": 1 + (u - 2 + k) % n, "preference": "LIKE", "is_favourite": k % 5 == 0}
+                   for u in range(1, n_users + 1) for k in range(per_user)]
+    reviews = [{"user_id": u, "music_item_id": 2, "rating": 1 + u % 5, "text": "ok"} for u in range(3, n_users + 1)]
+    with engine.begin() as conn:
+        conn.execute(insert(models.Artist), [{"id": a, "name": f"Artist {a}"} for a in range(1, n_artists + 1)])
+        conn.execute(insert(models.Genre), [{"id": g, "name": f"Genre {g}"} for g in range(1, n_genres + 1)])
+        conn.execute(insert(models.User), users)
+        conn.execute(insert(models.MusicItem), items)
+        conn.execute(insert(models.MusicItemArtist), artist_links)
+        conn.execute(insert(models.MusicItemGenre), genre_links)
+        conn.execute(insert(models.AlbumTrack), album_tracks)
+        conn.execute(insert(models.UserCollection), collections)
+        conn.execute(insert(models.Review), reviews)
+        conn.execute(insert(models.TrackFile), [{"track_id": 2, "filename": "t.mp3", "content_type": "audio/mpeg",
+                                                  "file_data": b"\xff\xfb" * 4096, "compressed": False}])
+    if engine.dialect.name == "postgresql":
+        # the explicit ids above don't advance the serial sequences
+        with engine.begin() as conn:
+            for table in ("users", "artists", "genres", "music_items", "reviews", "track_files"):
+                conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"))
+    # near-duplicate fingerprints for tracks 2 and 3 (identical but for the last band)
+    db = SessionLocal()
+    base = [(i * 2654435761) & 0xFFFFFFFF for i in range(fingerprint.SIGNATURE_SIZE)]
+    fingerprint.index_track(db, 2, fingerprint.pack(base))
+    fingerprint.index_track(db, 3, fingerprint.pack(base[:-1] + [0]))
+    db.commit()
+    db.close()
+    db = SessionLocal()
+    trending.backfill(db)  # every seeded collection entry/review is from just now
+    trending.refresh(db)
+    db.close()
+    in_collection = {c["music_item_id"] for c in collections if c["user_id"] == 2}
+    # a track outside user 2's collection, used by the collection write scenarios
+    free_track = next(i for i in range(n, 0, -1) if (i - 1) % (ALBUM_SIZE + 1) and i not in in_collection)
+    return {"n": n, "album": 1, "track": 2, "free_track": free_track}
+
+
+# endpoint name -> (method, url, request kwargs). Run in this order; writes come after reads.
+# The events stream/websocket are long lived connections and are not measured.
+SKIP = {"stream_events"}
+
+
+def scenarios(ctx: dict) -> dict:
+    album, track, free = ctx["album"], ctx["track"], ctx["free_track"]
+    return {
+        "root": ("GET", "/", {}),
+        "list_users": ("GET", "/auth/users", {}),
+        "list_artists": ("GET", "/artists", {}),
+        "list_genres": ("GET", "/genres", {}),
+        "list_music_items": ("GET", "/music-items", {"params": {"limit": 50, "genre_id": 2}}),  # genre 2 includes album 1
+        "list_trending_items": ("GET", "/music-items/trending", {"params": {"window": "week", "genre_id": 2}}),
+        "batch_get_music_items": ("GET", "/music-items:batch", {"params": {"ids": f"{album},{track},2,3", "fields": "title,artists,tracks"}}),
+        "get_music_item": ("GET", f"/music-items/{album}", {}),
+        "get_collection": ("GET", "/users/2/collection", {}),
+        "get_user_stats": ("GET", "/users/2/stats", {}),
+        "list_reviews_for_item": ("GET", f"/reviews/item/{track}", {}),
+        "download_track_file": ("GET", f"/files/tracks/{track}/file", {"headers": USER}),
+        "stream_album": ("GET", f"/music-items/{album}/stream", {"headers": {**USER, "Range": "bytes=100-"}}),
+        "get_track_duplicates": ("GET", f"/files/tracks/{track}/duplicates", {"headers": ADMIN}),
+        "album_playlist": ("GET", f"/music-items/{album}/stream.m3u8", {"headers": USER}),
+        "statement_cache": ("GET", "/admin/statement-cache", {"headers": ADMIN}),
+        "export_catalog": ("GET", "/admin/export", {"headers": ADMIN, "params": {"since": "2100-01-01T00:00:00"}}),
+        "create_user": ("POST", "/auth/users", {"json": {"email": "new@example.com", "display_name": "New", "role": "USER"}}),
+        "create_artist": ("POST", "/artists", {"headers": ADMIN, "json": {"name": "New Artist"}}),
+        "create_genre": ("POST", "/genres", {"headers": ADMIN, "json": {"name": "New Genre"}}),
+        "create_music_item": ("POST", "/music-items", {"headers": ADMIN, "json": {"title": "New", "item_type": "ALBUM", "artist_ids": [1], "genre_ids": [1], "track_ids": [3, 4]}}),
+        "update_music_item": ("PUT", f"/music-items/{album}", {"headers": ADMIN, "json": {"title": "Renamed", "genre_ids": [2]}}),
+        "patch_album_tracks": ("PATCH", f"/music-items/{album}/tracks", {"headers": ADMIN, "json": {"operations": [{"op": "move", "track_id": 3, "position": 1}]}}),
+        "add_to_collection": ("POST", f"/users/2/collection/{free}", {"headers": USER}),
+        "update_collection_entry": ("PATCH", f"/users/2/collection/{free}", {"headers": USER, "json": {"preference": "LIKE", "is_favourite": True}}),
+        "remove_from_collection": ("DELETE", f"/users/2/collection/{free}", {"headers": USER}),
+        "create_or_update_review": ("POST", "/reviews", {"headers": USER, "json": {"music_item_id": track, "rating": 5}}),
+        "delete_review": ("DELETE", "/reviews/1", {"headers": ADMIN}),
+        "upload_track_file": ("POST", f"/files/tracks/{track}/file", {"headers": ADMIN, "files": {"upload": ("t.mp3", b"not really audio", "audio/mpeg")}}),
+        "delete_music_item": ("DELETE", f"/music-items/{track}", {"headers": ADMIN}),
+        "bulk_delete_music_items": ("POST", "/music-items/bulk-delete", {"headers": ADMIN, "json": {"ids": [5, 6, 7]}}),
+    }
+
+
+def measure(client: TestClient, ctx: dict) -> dict:
+    results = {}
+    counter = {"n": 0}
+
+    def count(*_):
+        counter["n"] += 1
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        for name, (method, url, kwargs) in scenarios(ctx).items():
+            counter["n"] = 0
+            start = time.perf_counter()
+            response = client.request(method, url, **kwargs)
+            elapsed = (time.perf_counter() - start) * 1000
+            if response.status_code >= 400:
+                raise RuntimeError(f"{name}: {method} {url} -> {response.status_code} {response.text[:200]}")
+            results[name] = (counter["n"], elapsed)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    return results
+
+
+def check_listing(client: TestClient) -> list[str]:
+    """Filtered listings return every matching item once (artist 1 has items in two roles)
+    and limit/offset pages add up to the full list."""
+    failures = []
+    for params in ({"artist_id": 1}, {"genre_id": 2}, {"artist_id": 1, "genre_id": 2}):
+        full = [mi["id"] for mi in client.get("/music-items", params=params).json()]
+        with engine.connect() as conn:
+            expected = sorted(conn.execute(select(models.MusicItem.id).where(
+                *([models.MusicItem.artists.any(artist_id=params["artist_id"])] if "artist_id" in params else []),
+                *([models.MusicItem.genres.any(genre_id=params["genre_id"])] if "genre_id" in params else []))).scalars())
+        paged, offset = [], 0
+        while page := [mi["id"] for mi in client.get("/music-items", params={**params, "limit": 7, "offset": offset}).json()]:
+            paged += page
+            offset += 7
+        if sorted(full) != expected or paged != expected:
+            failures.append(f"list_music_items {params}: {len(full)} items / {len(paged)} paged, expected {len(expected)} distinct")
+    return failures
+
+
+def main():
+    sizes = [int(s) for s in args.sizes.split(",")]
+    app = create_app()
+    budgets = {r.endpoint.__name__: getattr(r.endpoint, "query_budget", None)
+               for r in app.routes if isinstance(r, APIRoute)}
+    budgets = {k: v for k, v in budgets.items() if k not in SKIP}
+
+    per_size = {}
+    failures = []
+    client = TestClient(app)  # no lifespan: no pool warm-up / background tasks interfering with counts
+    for n in sizes:
+        ctx = seed(n)
+        failures += check_listing(client)
+        per_size[n] = measure(client, ctx)
+
+    covered = set(per_size[sizes[0]])
+    for name in sorted(set(budgets) - covered):
+        failures.append(f"{name}: no scenario in benchmarks/query_budgets.py")
+    header = "route".ljust(26) + "".join(f"{f'n={n}':>18}" for n in sizes) + "   budget"
+    print(header)
+    for name in scenarios({"album": 0, "track": 0, "free_track": 0}):
+        budget = budgets.get(name)
+        cells = "".join(f"{per_size[n][name][0]:>6}q {per_size[n][name][1]:>8.1f}ms" for n in sizes)
+        print(f"{name:<26}{cells}   {f'{budget.queries}q {budget.ms:g}ms' if budget else 'MISSING'}")
+        if budget is None:
+            failures.append(f"{name}: no @query_budget on the route")
+            continue
+        counts = [per_size[n][name][0] for n in sizes]
+        if max(counts) > budget.queries:
+            failures.append(f"{name}: {max(counts)} statements > budget {budget.queries}")
+        if budget.constant and len(set(counts)) > 1:
+            failures.append(f"{name}: statement count grows with data size {dict(zip(sizes, counts))}")
+        slowest = per_size[sizes[-1]][name][1]
+        if slowest > budget.ms:
+            failures.append(f"{name}: {slowest:.1f} ms > budget {budget.ms:g} ms at n={sizes[-1]}")
+
+    if failures:
+        print("\nFAILED:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("\nall routes within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Cold start benchmark: import time of `main` and time until the first response.
+
+    python benchmarks/startup.py [--runs 5] [--path /music-items]
+
+Uses the database from .env (APP_DATABASE_URL) like the app itself.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = "import time; t=time.perf_counter(); import main; print(time.perf_counter()-t)"
+
+
+def measure_import() -> float:
+    out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_first_response(path: str) -> tuple[float, float]:
+    """Returns (seconds until the server answers /, seconds for the first request to `path`)."""
+    port = free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:create_app", "--factory", "--port", str(port)],
+                            cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1).read()
+                break
+            except OSError:
+                if proc.poll() is not None:
+                    raise RuntimeError("uvicorn exited during startup")
+                time.sleep(0.01)
+        ready = time.perf_counter() - start
+        t = time.perf_counter()
+        urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=30).read()
+        return ready, time.perf_counter() - t
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/genres", help="first real (DB backed) request")
+    args = parser.parse_args()
+
+    imports = [measure_import() for _ in range(args.runs)]
+    ready, first = zip(*[measure_first_response(args.path) for _ in range(args.runs)])
+
+    def fmt(values):
+        return f"median {statistics.median(values) * 1000:7.1f} ms  max {max(values) * 1000:7.1f} ms"
+
+    print(f"import main           {fmt(imports)}")
+    print(f"process -> ready      {fmt(ready)}")
+    print(f"first GET {args.path:<11} {fmt(first)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""Per-request CPU and planning time of the hot read paths: rebuilt vs cached statements.
+
+    python benchmarks/statement_cache.py [--db postgresql+psycopg://localhost/music_bench] [--items 5000] [--requests 300]
+
+Seeds a scratch database (tables are dropped and recreated - never point this at a real
+one) and runs get_current_user, get_music_item, list_music_items and get_collection
+--requests times each, every request in a fresh session:
+  * rebuilt: the db.query(...).options(...) chains the routes used to build per request,
+  * cached:  the routes as they are now (prebuilt / lambda statements).
+Prints the CPU time of this process per request (statement construction, cache key,
+result processing; with SQLite also the database itself, it runs in process) and the
+SQLAlchemy statement cache hit rate.
+On Postgres additionally: planning time of the statements a request issues
+(EXPLAIN SUMMARY) and the wall time per request without and with psycopg prepared
+statements (APP_DB_PREPARE_THRESHOLD), plus how many executions used a generic plan
+(psycopg deallocates prepared statements on rollback, which ends every read-only session).
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ALBUM_SIZE = 10
+COLLECTION_SIZE = 50
+ROUNDS = 10
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="sqlite:////tmp/statement_cache.db")
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=300)
+    return parser.parse_args()
+
+
+args = parse_args()
+# Settings are read at import time - configure before importing the app
+os.environ["APP_DATABASE_URL"] = args.db
+os.environ.setdefault("APP_ECHO_SQL", "false")
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import event, insert, text  # noqa: E402
+from sqlalchemy.engine.interfaces import CacheStats  # noqa: E402
+from sqlalchemy.orm import Session, selectinload  # noqa: E402
+
+from app import models  # noqa: E402
+from app.core.auth import get_current_user  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.database import Base, engine, statement_cache_counts  # noqa: E402
+from app.routers.collections import get_collection, _serialize_collection_entry  # noqa: E402
+from app.routers.music_items import get_music_item, list_music_items, serialize_music_item  # noqa: E402
+
+
+def seed():
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    n = args.items
+    items, artists, genres, tracks = [], [], [], []
+    for i in range(1, n + 1):
+        offset = (i - 1) % (ALBUM_SIZE + 1)
+        items.append({"id": i, "title": f"Item {i}", "item_type": "TRACK" if offset else "ALBUM", "release_year": 1960 + i % 60})
+        artists.append({"music_item_id": i, "artist_id": 1 + i % 100, "role": "PRIMARY"})
+        genres.append({"music_item_id": i, "genre_id": 1 + i % 20})
+        if offset:
+            tracks.append({"album_id": i - offset, "track_id": i, "track_number": offset * 1024})
+    with engine.begin() as conn:
+        conn.execute(insert(models.Artist), [{"id": a, "name": f"Artist {a}"} for a in range(1, 101)])
+        conn.execute(insert(models.Genre), [{"id": g, "name": f"Genre {g}"} for g in range(1, 21)])
+        conn.execute(insert(models.User), [{"id": u, "email": f"user{u}@example.com", "display_name": f"User {u}", "role": "USER"} for u in (1, 2)])
+        conn.execute(insert(models.MusicItem), items)
+        conn.execute(insert(models.MusicItemArtist), artists)
+        conn.execute(insert(models.MusicItemGenre), genres)
+        conn.execute(insert(models.AlbumTrack), tracks)
+        conn.execute(insert(models.UserCollection), [{"user_id": 2, "music_item_id": 1 + k * 7, "preference": "LIKE"} for k in range(COLLECTION_SIZE)])
+    if engine.dialect.name == "postgresql":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM ANALYZE"))
+
+
+# The loader chains as the routes built them per request before they moved to cached statements
+def _rebuilt_item_options(via=None):
+    def start(attr):
+        return selectinload(via).selectinload(attr) if via is not None else selectinload(attr)
+    return [
+        start(models.MusicItem.artists).selectinload(models.MusicItemArtist.artist),
+        start(models.MusicItem.genres).selectinload(models.MusicItemGenre.genre),
+        start(models.MusicItem.album_tracks).selectinload(models.AlbumTrack.track).selectinload(models.MusicItem.artists).selectinload(models.MusicItemArtist.artist),
+        start(models.MusicItem.album_tracks).selectinload(models.AlbumTrack.track).selectinload(models.MusicItem.genres).selectinload(models.MusicItemGenre.genre),
+    ]
+
+
+def rebuilt_list(db):
+    items = (db.query(models.MusicItem).options(*_rebuilt_item_options())
+             .join(models.MusicItem.genres).filter(models.MusicItemGenre.genre_id == 2)
+             .order_by(models.MusicItem.id).offset(0).limit(50).all())
+    return [serialize_music_item(mi) for mi in items]
+
+
+def rebuilt_item(db):
+    mi = db.query(models.MusicItem).options(*_rebuilt_item_options()).filter(models.MusicItem.id == 1).one_or_none()
+    return serialize_music_item(mi)
+
+
+def rebuilt_collection(db):
+    entries = (db.query(models.UserCollection).options(*_rebuilt_item_options(models.UserCollection.music_item))
+               .filter(models.UserCollection.user_id == 2).all())
+    return [_serialize_collection_entry(e) for e in entries]
+
+
+PATHS = {
+    "get_current_user": (lambda db: db.get(models.User, 2),
+                         lambda db: get_current_user(db, 2, "USER")),
+    "get_music_item": (rebuilt_item, lambda db: get_music_item(1, db)),
+    "list_music_items": (rebuilt_list, lambda db: list_music_items(db=db, q=None, genre_id=2, artist_id=None, offset=0, limit=50)),
+    "get_collection": (rebuilt_collection, lambda db: get_collection(2, db)),
+}
+
+
+def run(variants: dict) -> dict:
+    """variant -> (connection, request) in, variant -> (CPU ms, wall ms) per request out.
+    The variants take turns in ROUNDS rounds (drift in machine load hits all of them alike),
+    medians over the rounds."""
+    cpu, wall = {v: [] for v in variants}, {v: [] for v in variants}
+    per_round = max(1, args.requests // ROUNDS)
+    for _ in range(ROUNDS):
+        for variant, (conn, fn) in variants.items():
+            c, w = time.process_time(), time.perf_counter()
+            for _ in range(per_round):
+                with Session(bind=conn) as db:
+                    fn(db)
+            cpu[variant].append((time.process_time() - c) / per_round * 1000)
+            wall[variant].append((time.perf_counter() - w) / per_round * 1000)
+    return {v: (statistics.median(cpu[v]), statistics.median(wall[v])) for v in variants}
+
+
+def planning_ms(conn, fn) -> tuple[int, float]:
+    """Statements one request issues and the sum of their planning times."""
+    captured = []
+
+    def capture(_conn, _cursor, statement, parameters, *_):
+        captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        with Session(bind=conn) as db:
+            fn(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    total = 0.0
+    for statement, parameters in captured:
+        out = conn.exec_driver_sql("EXPLAIN (SUMMARY, FORMAT JSON) " + statement, parameters).scalar()
+        total += (json.loads(out) if isinstance(out, str) else out)[0]["Planning Time"]
+    return len(captured), total
+
+
+def cache_counts() -> tuple[int, int]:
+    return statement_cache_counts[CacheStats.CACHE_HIT], statement_cache_counts[CacheStats.CACHE_MISS]
+
+
+def main():
+    seed()
+    postgres = engine.dialect.name == "postgresql"
+    print(f"{args.items} items, {args.requests} requests per path and variant, {engine.dialect.name}\n")
+    header = f"{'path':<18}{'cpu rebuilt':>12}{'cpu cached':>12}{'saved':>9}"
+    if postgres:
+        header += f"{'stmts':>7}{'planning':>10}{'wall unprep':>13}{'wall prep':>11}"
+    print(header + "   (ms per request)")
+
+    lookups = [0, 0]
+    for name, (rebuilt, cached) in PATHS.items():
+        engine.dispose()  # fresh connections: nothing prepared yet
+        with engine.connect() as conn, engine.connect() as prepared:
+            # conn without server side prepare, prepared with the APP_DB_PREPARE_THRESHOLD of the settings
+            variants = {"rebuilt": (conn, rebuilt), "cached": (conn, cached)}
+            if postgres:
+                conn.connection.driver_connection.prepare_threshold = None
+                variants["prepared"] = (prepared, cached)
+            for c, fn in variants.values():  # warm the compiled cache
+                with Session(bind=c) as db:
+                    fn(db)
+            before = cache_counts()
+            results = run(variants)
+            hits, misses = cache_counts()
+            lookups[0] += hits - before[0]
+            lookups[1] += misses - before[1]
+            cpu_rebuilt, cpu_cached = results["rebuilt"][0], results["cached"][0]
+            line = f"{name:<18}{cpu_rebuilt:>12.3f}{cpu_cached:>12.3f}{cpu_rebuilt - cpu_cached:>9.3f}"
+            if postgres:
+                count, planning = planning_ms(conn, cached)
+                generic, custom = prepared.exec_driver_sql(
+                    "SELECT coalesce(sum(generic_plans), 0), coalesce(sum(custom_plans), 0) FROM pg_prepared_statements").one()
+                line += (f"{count:>7}{planning:>10.3f}{results['cached'][1]:>13.3f}{results['prepared'][1]:>11.3f}"
+                         f"   generic/custom plans {generic}/{custom}")
+        print(line)
+
+    print()
+    hits, misses = lookups
+    print(f"statement cache hit rate: {hits / max(hits + misses, 1):.1%} of {hits + misses} statements")
+    if postgres:
+        print(f"prepared statements: APP_DB_PREPARE_THRESHOLD={settings.db_prepare_threshold}, APP_DB_PREPARED_MAX={settings.db_prepared_max}")
+
+
+if __name__ == "__main__":
+    main()
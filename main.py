@@ -1,45 +1,100 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-
-from app.core.auth import router as auth_router
-from app.routers.music_items import router as music_router
-from app.routers.reviews import router as reviews_router
-from app.routers.collections import router as collections_router
-from app.routers.artists import router as artists_router
-from app.routers.genres import router as genres_router
-from app.routers.track_files import router as track_files_router
-from app.database import init_db
 from contextlib import asynccontextmanager
+import asyncio
 
-app = FastAPI(title="Music Collection Manager", version="1.0.0")
+from app.database import init_db
+from app.core.events import hub
+from app.core.config import settings
+from app.core.budgets import query_budget
 
-# CORS (For real production we would restrict origins)
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    from app.core.startup import prewarm
     init_db()
+    # blocking DB work - keep it off the event loop
+    await asyncio.to_thread(prewarm)
+    hub.start(asyncio.get_running_loop())
+    index_task = None
+    if settings.catalog_index_enabled:
+        from app.core.catalog_index import catalog_index
+        index_task = asyncio.create_task(catalog_index.run(hub))  # builds, then follows changes
+    reconcile_task = None
+    if settings.stats_reconcile_seconds > 0:
+        from app.core.stats import reconcile_periodically
+        reconcile_task = asyncio.create_task(reconcile_periodically(settings.stats_reconcile_seconds))
+    trending_task = None
+    if settings.trending_refresh_seconds > 0:
+        from app.core.trending import refresh_periodically
+        trending_task = asyncio.create_task(refresh_periodically(settings.trending_refresh_seconds))
     yield
+    if index_task:
+        index_task.cancel()
+    if reconcile_task:
+        reconcile_task.cancel()
+    if trending_task:
+        trending_task.cancel()
+    hub.stop()
+
+
+def create_app() -> FastAPI:
+    from app.core.auth import router as auth_router
+    from app.routers.music_items import router as music_router
+    from app.routers.reviews import router as reviews_router
+    from app.routers.collections import router as collections_router
+    from app.routers.artists import router as artists_router
+    from app.routers.genres import router as genres_router
+    from app.routers.track_files import router as track_files_router
+    from app.routers.events import router as events_router
+    from app.routers.export import router as export_router
+    from app.routers.metrics import router as metrics_router
+    from app.core.admission import pool_timeout_handler
+    from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+    app = FastAPI(title="Music Collection Manager", version="1.0.0", lifespan=lifespan)
+
+    # CORS (For real production we would restrict origins)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    app.add_exception_handler(PoolTimeoutError, pool_timeout_handler)
+
+    @app.get("/", tags=["meta"])
+    @query_budget(queries=0, ms=50)
+    def root():
+        return {"message": "Music Collection Manager API", "docs": "/docs"}
+
+    # Simple user management demo (header-based)
+    app.include_router(auth_router, prefix="/auth", tags=["auth-demo"])
+
+    # Core resources
+    app.include_router(music_router, prefix="/music-items", tags=["music-items"])
+    app.include_router(artists_router, prefix="/artists", tags=["artists"])
+    app.include_router(genres_router, prefix="/genres", tags=["genres"])
+    app.include_router(reviews_router, prefix="/reviews", tags=["reviews"])
+    app.include_router(collections_router, prefix="/users", tags=["collections"])
+    app.include_router(track_files_router, prefix="/files", tags=["track-files"])
+    app.include_router(events_router, prefix="/events", tags=["events"])
+    app.include_router(export_router, prefix="/admin", tags=["admin"])
+    app.include_router(metrics_router, prefix="/admin", tags=["admin"])
+    return app
 
-app.router.lifespan_context = lifespan
 
-@app.get("/", tags=["meta"])
-def root():
-    return {"message": "Music Collection Manager API", "docs": "/docs"}
+_app = None
 
-# Simple user management demo (header-based)
-app.include_router(auth_router, prefix="/auth", tags=["auth-demo"])
 
-# Core resources
-app.include_router(music_router, prefix="/music-items", tags=["music-items"])
-app.include_router(artists_router, prefix="/artists", tags=["artists"])
-app.include_router(genres_router, prefix="/genres", tags=["genres"])
-app.include_router(reviews_router, prefix="/reviews", tags=["reviews"])
-app.include_router(collections_router, prefix="/users", tags=["collections"])
-app.include_router(track_files_router, prefix="/files", tags=["track-files"])
\ No newline at end of file
+def __getattr__(name: str):
+    # uvicorn main:app - built on first access instead of at import, so `import main`
+    # (and uvicorn main:create_app --factory) doesn't pay for the routers twice
+    global _app
+    if name != "app":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if _app is None:
+        _app = create_app()
+    return _app